@@ -1,6 +1,10 @@
-import requests, json, datetime, os
+import json, datetime, os, sys
 from dotenv import load_dotenv
 from datetime import timezone
+# Add the Dashboard folder to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'dashboard'))
+
+import console, event_sink
 load_dotenv()
 class Runtime:
     def __init__(self, image, collection_name, fs_allowlist, rule_name, network_ports, allowed_processes, modifiedTime):
@@ -178,6 +182,9 @@ def get_all_ports(data_port):
         
 
 def read_json(filename):
+    # Container model datasets are written as NDJSON by the report generator
+    if filename.endswith((".ndjson", ".ndjson.gz")):
+        return event_sink.read_events(filename)
     with open(filename, 'r') as f:
         data = json.load(f)
     return data
@@ -250,17 +257,14 @@ def add_runtime_rule(json_data):
     return all_containers
 
 def create_collection(data):
-    url = "{}/api/v33.01/collections".format(os.getenv("CONSOLE_PATH"))
+    client = console.get_client()
+    path = "/api/v33.01/collections"
     collections = []
     for container in data["rules"]:
         
         collections.extend(container["collections"])
-        headers = {
-        'Accept': 'application/json',
-        'Authorization': 'Basic {}'.format(os.getenv("TOKEN"))
-        }
         # print(runtime_rules)
-        response = requests.request("POST", url, headers=headers, data=json.dumps(container["collections"][0]))
+        response = client.post(path, data=json.dumps(container["collections"][0]))
         if response.status_code == 409:
             
             print("Error adding collection: {} - {}".format(response.status_code, "Collection '{}' already exists.".format(container["collections"][0]["name"])))
@@ -270,14 +274,11 @@ def create_collection(data):
             print("Error adding collection: {} - {} - {}".format(response.status_code, container["collections"][0]["name"], response.content))
 def put_to_prisma(runtime_rules):
     create_collection(runtime_rules)
-    url = "{}/api/v1/policies/runtime/container".format(os.getenv("CONSOLE_PATH"))
+    client = console.get_client()
+    path = "/api/v1/policies/runtime/container"
     
-    headers = {
-    'Accept': 'application/json',
-    'Authorization': 'Basic {}'.format(os.getenv("TOKEN"))
-    }
     # print(runtime_rules)
-    response = requests.request("PUT", url, headers=headers, data=json.dumps(runtime_rules))
+    response = client.put(path, data=json.dumps(runtime_rules))
     if response.status_code != 200:
         print("Error adding rule: {} - {}".format(response.status_code, response.content))
     elif response.status_code == 409:
@@ -287,7 +288,7 @@ def put_to_prisma(runtime_rules):
         
     # for rule in runtime_rules["rules"]:
     #     # print(rule)
-    #     response = requests.request("PUT", url, headers=headers, data=rule)
+    #     response = client.put(path, data=rule)
     #     print("Adding rule {}".format(rule["name"]))
     #     if response.status_code != 200:
     #         print("Error adding rule: {} - {}".format(rule["name"], response.text))
@@ -296,17 +297,12 @@ def put_to_prisma(runtime_rules):
     #         print("Rule {} added successfully".format(rule["name"]))
     #         break
 def main():
-    url = "{}/api/v33.01/policies/runtime/container".format(os.getenv("CONSOLE_PATH"))
-    headers = {
-    'Accept': 'application/json',
-    'Authorization': 'Basic {}'.format(os.getenv("TOKEN"))
-    }
     with open('container_put.json', 'r') as f:
         data = json.load(f)
     
     # print(json.dumps(data, indent=2))
     # put_to_prisma(data) 
-    # response = requests.request("GET", url, headers=headers)
+    # response = client.get(path)
     # all_rules = response.json()
     
     all_rules = {
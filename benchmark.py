@@ -0,0 +1,122 @@
+import argparse, contextlib, importlib.util, multiprocessing, os, shutil, sys, tempfile, time, json
+from urllib.request import urlopen
+import mock_console
+
+# End-to-end benchmark of the report generators and the runtime rule pusher
+# against a local mock console. Every flow runs in its own process so its peak
+# memory is measured in isolation.
+#   python benchmark.py --events 100000 --latency 20 --rate-429 0.02
+
+FLOWS = ["waas", "runtime", "container", "rules", "all"]
+
+
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def get_stats(console_url):
+    with urlopen(console_url + "/mock/stats") as response:
+        return json.loads(response.read())
+
+
+def run_flow(name, workdir, env, verbose, results):
+    os.environ.update(env)
+    os.chdir(workdir)
+    if importlib.util.find_spec("resource") is None:
+        # No getrusage on this platform; peak_memory_mb reads tracemalloc instead
+        import tracemalloc
+        tracemalloc.start()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with output:
+        import prisma_report_generator, add_runtime_rule, db
+        db.create_db()
+        if name == "rules":
+            # The rule pusher works from a container model dataset; build it untimed
+            dataset = prisma_report_generator.generate_container_model_report()
+        before = get_stats(env["CONSOLE_PATH"])
+        start = time.perf_counter()
+        if name == "waas":
+            result = prisma_report_generator.generate_waas_report(full=True)
+        elif name == "runtime":
+            result = prisma_report_generator.generate_runtime_report(full=True)
+        elif name == "container":
+            result = prisma_report_generator.generate_container_model_report()
+        elif name == "all":
+            result = prisma_report_generator.generate_all_reports(full=True)
+        else:
+            rules = add_runtime_rule.add_runtime_rule(dataset)
+            add_runtime_rule.put_to_prisma({"rules": [rule.dump_json() for rule in rules]})
+            result = None
+        elapsed = time.perf_counter() - start
+        after = get_stats(env["CONSOLE_PATH"])
+    stats = {key: after[key] - before[key] for key in after}
+    # The rule flow is measured by the rules it pushes, the others by rows fetched
+    count = stats["rules"] if name == "rules" else stats["rows"]
+    results.put({
+        "flow": name,
+        "seconds": elapsed,
+        "requests": stats["requests"],
+        "throttled": stats["throttled"],
+        "rows": count,
+        "rows_per_second": count / elapsed if elapsed else 0,
+        "peak_mb": peak_memory_mb(),
+        "status": result if isinstance(result, (int, dict)) else None,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the report generators against a mock Prisma console")
+    parser.add_argument("--events", type=int, default=20000, help="runtime and WAAS audits served per endpoint")
+    parser.add_argument("--models", type=int, default=200, help="container profiles served")
+    parser.add_argument("--latency", type=float, default=10.0, help="delay added to every request, in milliseconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--flows", default=",".join(FLOWS), help="comma separated flows to run: {}".format(", ".join(FLOWS)))
+    parser.add_argument("--keep", action="store_true", help="keep the generated reports in the work directory")
+    parser.add_argument("--verbose", action="store_true", help="show the generators' own output")
+    args = parser.parse_args()
+
+    console = mock_console.MockConsole(args.events, args.models, args.latency / 1000, args.rate_429, args.retry_after).start()
+    workdir = tempfile.mkdtemp(prefix="prisma_benchmark_")
+    env = {"CONSOLE_PATH": console.url, "TOKEN": "benchmark"}
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    rows = []
+    try:
+        for name in [flow.strip() for flow in args.flows.split(",") if flow.strip()]:
+            if name not in FLOWS:
+                print("Unknown flow: {}".format(name))
+                continue
+            process = context.Process(target=run_flow, args=(name, workdir, env, args.verbose, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print("Flow {} failed with exit code {}".format(name, process.exitcode))
+                continue
+            rows.append(results.get())
+    finally:
+        console.stop()
+        if args.keep:
+            print("Reports kept in {}".format(workdir))
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print("{:<10} {:>10} {:>10} {:>10} {:>10} {:>12} {:>10}".format("flow", "wall (s)", "requests", "429s", "rows", "rows/s", "peak MB"))
+    for row in rows:
+        print("{:<10} {:>10.2f} {:>10} {:>10} {:>10} {:>12.0f} {:>10.1f}".format(
+            row["flow"], row["seconds"], row["requests"], row["throttled"], row["rows"], row["rows_per_second"], row["peak_mb"]))
+        if row["status"] is not None:
+            print("  {} returned status {}".format(row["flow"], row["status"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import streamlit as st
-import db, time
-import importlib.util, os
+import db, time, aggregates
+import importlib.util, os, json
 
 module_name = 'prisma_report_generator'
 module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'prisma_report_generator.py'))
@@ -56,6 +56,8 @@ st.write("# WAAS Events")
 st.write()
 st.write("#### 1. Generate WAAS Data")
 st.write("Before you can access the WAAS page, please generate the data if no data is on the list of reports.")
+waas_full = st.checkbox("Full refresh (fetch the whole WAAS history again)", key="waas_full_refresh",
+                        help="With FETCH_MODE=windows only the last FETCH_WINDOW_DAYS are fetched again; older events are kept from the previous data")
 if st.button("Generate WAAS Data", type="primary"):
     console_path = os.environ.get('CONSOLE_PATH')
     token = os.environ.get('TOKEN')
@@ -63,7 +65,7 @@ if st.button("Generate WAAS Data", type="primary"):
         st.error("Missing environment variable")
     else:
         with st.spinner("Generating WAAS data..."):
-            status_code = parent_module.generate_waas_report()
+            status_code = parent_module.generate_waas_report(full=waas_full)
             print("Status Code: ", status_code)
             if status_code != 200 and status_code is not None:
                 st.error("Failed to generate WAAS data: {} - Check the environment variable configuration.".format(status_code))
@@ -87,48 +89,69 @@ def delete_report(filename, table):
     st.write("**{}** will be deleted permanently.".format(filename))
 
     if st.button("Delete"):
-        db.delete_file(data["fullpath"], table)
+        dataset = db.delete_file(data["fullpath"], table)
         os.remove(data["fullpath"])
+        if dataset is not None and os.path.exists(dataset):
+            os.remove(dataset)
+        if os.path.exists(aggregates.sidecar_path(data["fullpath"])):
+            os.remove(aggregates.sidecar_path(data["fullpath"]))
+        st.rerun()
+
+def describe_report(data):
+    # Rendered from the catalogue; reports from before it was recorded only show their timestamp
+    if data["rows"] is None:
+        return data["timestamp"]
+    details = "{:,} rows · {:.1f} MB".format(data["rows"], data["size"] / (1024 * 1024))
+    if data["first_time"] is not None:
+        details += " · {} to {}".format(data["first_time"], data["last_time"])
+    sheets = json.loads(data["sheets"]) if data["sheets"] else []
+    if len(sheets) > 1:
+        details += " · {} sheets".format(len(sheets))
+    return "{}\n\n{}".format(data["timestamp"], details)
+
+def download_report(data):
+    # The file is only read once the user asks for it, not on every rerun
+    key = "download_{}".format(data["fullpath"])
+    if st.session_state.get(key):
+        with open(data["fullpath"], "rb") as f:
+            file_data = f.read()
+        st.download_button("Download", data=file_data, file_name=data["filename"], mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                           key="save_{}".format(data["fullpath"]), on_click=lambda: st.session_state.pop(key, None))
+    elif st.button("Prepare", key="prepare_{}".format(data["fullpath"]), help="Load the file for download"):
+        st.session_state[key] = True
         st.rerun()
         
 data_report_waas = []
 data_filename = []
 try:
-    data_filename = db.get_files("waas_files")
+    data_filename = db.get_reports("waas_files", limit=5)
 except Exception as e:
     print(e)
 if len(data_filename) == 0:
     st.write("No WAAS data found. Click **Generate WAAS Data** button above.")
 else:
     for file in data_filename:
-        index, filename, timestamp = file
+        filename = file["filename"]
         fullpath = filename
         if "\\" in filename:
             filename = filename.split('\\')[1]
         elif "/" in filename:
             filename = filename.split('/')[1]
         
-        new_data = {
-            "filename": filename,
-            "timestamp": timestamp,
-            "fullpath": fullpath
-        }
+        new_data = dict(file, filename=filename, fullpath=fullpath)
         data_report_waas.append(new_data)
     if len(data_report_waas) > 5:
         data_report_waas = data_report_waas[-5:]
     for idx, data in enumerate(data_report_waas):
         left_col, right_col = st.columns(2)
-        with open(data["fullpath"], "rb") as f:
-            file_data = f.read()
         with left_col:
-            st.write("**{}**\n{}".format(data["filename"], data["timestamp"]))
+            st.write("**{}**\n{}".format(data["filename"], describe_report(data)))
         with right_col:
             view_col, download_col, del_col = st.columns(3)
             with view_col:
                 st.link_button("View", url="/WAAS?filename={}".format(data["fullpath"]))
             with download_col:
-                
-                st.download_button("Download", data=file_data, file_name=data["filename"], mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                download_report(data)
             with del_col:
                 if st.button("Delete", key=data["fullpath"]):
                     delete_report(data["filename"], "waas_files")
@@ -141,6 +164,8 @@ st.write("# Runtime Events")
 st.write()
 st.write("#### 1. Generate Runtime Data")
 st.write("Before you can access the Runtime page, please generate the data if no data is on the list of reports.")
+runtime_full = st.checkbox("Full refresh (fetch the whole Runtime history again)", key="runtime_full_refresh",
+                        help="With FETCH_MODE=windows only the last FETCH_WINDOW_DAYS are fetched again; older events are kept from the previous data")
 if st.button("Generate Runtime Data", type="primary"):
     console_path = os.environ.get('CONSOLE_PATH')
     token = os.environ.get('TOKEN')
@@ -148,7 +173,7 @@ if st.button("Generate Runtime Data", type="primary"):
         st.error("Missing environment variable")
     else:
         with st.spinner("Generating Runtime data..."):
-            status_code = parent_module.generate_runtime_report()
+            status_code = parent_module.generate_runtime_report(full=runtime_full)
             print("Status Code: ", status_code)
             if status_code != 200 and status_code is not None:
                 st.error("Failed to generate Runtime data: {} - Check the environment variable configuration.".format(status_code))
@@ -168,39 +193,32 @@ st.markdown(
 )
         
 data_report_runtime = []
-data_filename = db.get_files("runtime_files")
+data_filename = db.get_reports("runtime_files", limit=5)
 if len(data_filename) == 0:
     st.write("No Runtime data found. Click **Generate Runtime Data** button above.")
 else:
     for file in data_filename:
-        index, filename, timestamp = file
+        filename = file["filename"]
         fullpath = filename
         if "\\" in filename:
             filename = filename.split('\\')[1]
         elif "/" in filename:
             filename = filename.split('/')[1]
         
-        new_data = {
-            "filename": filename,
-            "timestamp": timestamp,
-            "fullpath": fullpath
-        }
+        new_data = dict(file, filename=filename, fullpath=fullpath)
         data_report_runtime.append(new_data)
     if len(data_report_runtime) > 5:
         data_report_runtime = data_report_runtime[-5:]
     for idx, data in enumerate(data_report_runtime):
         left_col, right_col = st.columns(2)
-        with open(data["fullpath"], "rb") as f:
-                    file_data = f.read()
         with left_col:
-            st.write("**{}**\n{}".format(data["filename"], data["timestamp"]))
+            st.write("**{}**\n{}".format(data["filename"], describe_report(data)))
         with right_col:
             view_col, download_col, del_col = st.columns(3)
             with view_col:
                 st.link_button("View", url="/Runtime?filename={}".format(data["fullpath"]))
             with download_col:
-                
-                st.download_button("Download", data=file_data, file_name=data["filename"], mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                download_report(data)
             with del_col:
                 if st.button("Delete", key=data["fullpath"]):
                     delete_report(data["filename"], "runtime_files")
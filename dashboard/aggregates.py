@@ -0,0 +1,98 @@
+import json, os
+from datetime import timedelta
+import pandas as pd
+
+# Chart inputs of a report's unfiltered view, computed by the generator and
+# stored next to the report as "<report>.aggregates.json". The dashboard pages
+# use them while no filter is applied and compute from the DataFrame otherwise.
+# Counts are stored as [value, count] pairs in the order pandas returned them.
+
+WAAS_COLUMNS = ["Host", "Time", "AttackType", "IPAddress", "Image", "Effect"]
+RUNTIME_COLUMNS = ["Cluster", "containerName", "AttackType"]
+BLOCKING_EFFECTS = ["alert", "ban", "prevent"]
+
+
+def sidecar_path(report_path):
+    # "WAAS Reports/WAAS_Report_x.xlsx" -> "WAAS Reports/WAAS_Report_x.aggregates.json"
+    return report_path.rsplit(".", 1)[0] + ".aggregates.json"
+
+
+def to_pairs(series):
+    return [[value, int(count)] for value, count in series.items()]
+
+
+def to_series(pairs, index_name, name):
+    return pd.Series([count for _, count in pairs], index=pd.Index([value for value, _ in pairs], name=index_name), name=name, dtype="int64")
+
+
+def attack_time_series(df):
+    # Attacks per type over the last 3 days of the data, hourly buckets interpolated every 15 minutes
+    end_time = df['Time'].max()
+    start_time = end_time - timedelta(days=3)
+    df_last_3_days = df[(df["Time"] >= start_time) & (df["Time"] <= end_time)]
+    if df_last_3_days.empty:
+        return pd.DataFrame(columns=['Time', 'AttackType', 'Count'])
+    attack_time = df_last_3_days.groupby([df['Time'].dt.floor('h'), 'AttackType']).size().reset_index(name='Count')
+    attack_time.set_index(['Time', 'AttackType'], inplace=True)
+    # A type has no count before its first hour, which interpolation leaves as NaN
+    attack_time = attack_time.unstack().resample('15min').interpolate('linear').fillna(0).stack().reset_index()
+    attack_time['Count'] = attack_time['Count'].round().astype(int)
+    return attack_time
+
+
+def waas_aggregates(df):
+    blocked = df[df["Effect"].isin(BLOCKING_EFFECTS)]
+    attack_time = attack_time_series(df)
+    return {
+        "counts": {
+            "Image": to_pairs(df["Image"].value_counts().head(5)),
+            "Host": to_pairs(df["Host"].value_counts().nlargest(5)),
+            "AttackType": to_pairs(df["AttackType"].value_counts().nlargest(5)),
+            "BlockedAttackType": to_pairs(blocked["AttackType"].value_counts().nlargest(5)),
+            "IPAddress": to_pairs(df["IPAddress"].value_counts().nlargest(5)),
+        },
+        "distinct": {"Host": to_pairs(df.groupby('Host')['AttackType'].nunique())},
+        "time": [[time.isoformat(), attack_type, int(count)] for time, attack_type, count in attack_time[['Time', 'AttackType', 'Count']].itertuples(index=False)],
+    }
+
+
+def runtime_aggregates(df):
+    return {
+        "counts": {
+            "containerName": to_pairs(df.groupby("containerName")["AttackType"].count()),
+            "AttackType": to_pairs(df["AttackType"].value_counts().head(5)),
+        },
+        "distinct": {
+            "Cluster": to_pairs(df.groupby("Cluster")["AttackType"].nunique()),
+            "containerName": to_pairs(df.groupby("containerName")["AttackType"].nunique()),
+        },
+    }
+
+
+def write_sidecar(report_path, parts, kind):
+    # `parts` are the parquet files the report is loaded from, `kind` "waas" or "runtime"
+    if not parts:
+        return None
+    columns = WAAS_COLUMNS if kind == "waas" else RUNTIME_COLUMNS
+    df = pd.concat([pd.read_parquet(part, columns=columns) for part in parts], ignore_index=True)
+    aggregates = waas_aggregates(df) if kind == "waas" else runtime_aggregates(df)
+    path = sidecar_path(report_path)
+    with open(path, "w") as f:
+        json.dump(aggregates, f, separators=(",", ":"))
+    return path
+
+
+def load_sidecar(report_path):
+    path = sidecar_path(report_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def time_frame(records):
+    if not records:
+        return pd.DataFrame(columns=['Time', 'AttackType', 'Count'])
+    attack_time = pd.DataFrame(records, columns=['Time', 'AttackType', 'Count'])
+    attack_time['Time'] = pd.to_datetime(attack_time['Time'])
+    return attack_time
@@ -0,0 +1,102 @@
+import requests, os, threading, time
+from requests.adapters import HTTPAdapter
+import fetcher, rate_limit
+
+
+def get_max_attempts():
+    # Attempts per request before a 429, 5xx or connection error is given up on
+    try:
+        return max(1, int(os.getenv("RETRY_ATTEMPTS", "10")))
+    except ValueError:
+        return 10
+
+
+def get_timeout():
+    # Seconds to wait for the console to connect or send data before the request is retried
+    try:
+        return max(1.0, float(os.getenv("REQUEST_TIMEOUT", "60")))
+    except ValueError:
+        return 60.0
+
+
+class ConsoleClient:
+    # One keep-alive session per console: owns the connection pool, gzip
+    # negotiation, base URL and auth header for every API call.
+    def __init__(self, console_path, token, pool_size=None, limiter=None):
+        self.base_url = console_path.rstrip("/")
+        self.token = token
+        self.limiter = limiter or rate_limit.get_limiter()
+        self.max_attempts = get_max_attempts()
+        self.timeout = get_timeout()
+        pool_size = pool_size or max(10, fetcher.get_workers())
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Authorization': 'Basic {}'.format(token)
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path):
+        return "{}{}".format(self.base_url, path)
+
+    def request(self, method, path, **kwargs):
+        # Every call draws from the shared rate limiter; throttled, failed and
+        # dropped requests are retried here so callers never lose a page.
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(1, self.max_attempts + 1):
+            self.limiter.acquire()
+            sent = time.monotonic()
+            try:
+                response = self.session.request(method, self.url(path), **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_attempts:
+                    raise
+                print("Request to {} failed: {}. Retrying in {} seconds...".format(self.url(path), e, attempt * 2))
+                time.sleep(attempt * 2)
+                continue
+
+            if response.status_code == 429:
+                retry_after = rate_limit.parse_retry_after(response.headers.get("Retry-After"))
+                rate = self.limiter.on_throttle(retry_after or attempt * 2, sent)
+                print("Rate limited. Retrying in {:.1f} seconds at {:.2f} requests/s...".format(retry_after or attempt * 2, rate))
+                continue
+            if response.status_code >= 500 and attempt < self.max_attempts:
+                print("Console returned {}. Retrying in {} seconds...".format(response.status_code, attempt * 2))
+                time.sleep(attempt * 2)
+                continue
+
+            self.limiter.on_success()
+            return response
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    # The Configuration page can change CONSOLE_PATH/TOKEN at runtime, so the
+    # shared client is rebuilt whenever they differ from the ones it was built with.
+    global _client
+    console_path = os.getenv("CONSOLE_PATH") or ""
+    token = os.getenv("TOKEN") or ""
+    with _client_lock:
+        if _client is None or _client.base_url != console_path.rstrip("/") or _client.token != token:
+            if _client is not None:
+                _client.close()
+            _client = ConsoleClient(console_path, token)
+        return _client
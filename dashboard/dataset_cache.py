@@ -0,0 +1,58 @@
+import os, threading
+from collections import OrderedDict
+
+# Report DataFrames, and the indexes built over them, shared by every session
+# of the dashboard process. Entries are keyed on the files a report was read
+# from with their mtime and size, so a rewritten report is read again; the
+# least recently used ones are evicted once the cache goes over its budget.
+_datasets = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_budget():
+    try:
+        return max(1, int(os.getenv("DATASET_CACHE_MB", "1024"))) * 1024 * 1024
+    except ValueError:
+        return 1024 * 1024 * 1024
+
+
+def files_key(paths):
+    key = []
+    for path in paths:
+        stat = os.stat(path)
+        key.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(key)
+
+
+def size_of(value):
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(deep=True).sum())
+    return int(value.nbytes)
+
+
+def load(paths, loader, kind="data"):
+    # `loader(paths)` or its cached result. The result is shared, so callers
+    # must not modify it. `kind` tells apart things derived from the same files;
+    # anything that is not a DataFrame reports its size as `nbytes`.
+    key = (kind,) + files_key(paths)
+    with _lock:
+        if key in _datasets:
+            _datasets.move_to_end(key)
+            return _datasets[key][0]
+    df = loader(paths)
+    size = size_of(df)
+    with _lock:
+        _datasets[key] = (df, size)
+        _datasets.move_to_end(key)
+        total = sum(cached for _, cached in _datasets.values())
+        budget = get_budget()
+        # The dataset just loaded is kept even when it is over the budget on its own
+        while total > budget and len(_datasets) > 1:
+            _, (_, evicted) = _datasets.popitem(last=False)
+            total -= evicted
+    return df
+
+
+def clear():
+    with _lock:
+        _datasets.clear()
@@ -1,63 +1,477 @@
-import sqlite3
+import contextlib, os, sqlite3, threading
+
+DB_PATH = 'prisma_report.db'
+
+# Report rows are also kept as indexed events, one table per report type, so the
+# dashboard can filter and aggregate them in SQL. Column names match the Excel
+# headers. Events are stored once per source dataset, keyed by their audit id,
+# and tagged with the report that first stored them; a report is the view of
+# its source up to the last event stored when it was written. Every full
+# refresh of a dataset starts a new generation of its source ("name@2"), so
+# events the new fetch no longer returns drop out of later reports.
+EVENT_TABLES = {
+    "waas_files": "waas_events",
+    "runtime_files": "runtime_events",
+}
+EVENT_COLUMNS = {
+    "waas_events": ["Host", "URL", "Time", "Namespace", "AttackType", "APIEndpoint", "IPAddress", "Path", "Image", "Effect"],
+    "runtime_events": ["containerName", "Cluster", "imageName", "Hostname", "Time", "Port", "Path", "Command", "Namespace", "AttackType", "Message"],
+}
+EVENT_INDEXES = {
+    "waas_events": ["report", "source", "Time", "Host", "Namespace", "AttackType", "Image"],
+    "runtime_events": ["report", "source", "Time", "Hostname", "Namespace", "Cluster", "AttackType", "imageName"],
+}
+
+# Connections are shared by the whole process rather than owned by a thread,
+# so they outlive the threads that open them: every Streamlit rerun runs on a
+# new thread and would otherwise start over with a cold connection. WAL lets
+# any number of readers (Streamlit sessions, fetch workers) run while a report
+# is being written, so reads borrow an idle connection from the pool without
+# any lock; writes go through transaction(), which serializes the writers of
+# the process on one writer connection per database file.
+_pool_lock = threading.Lock()
+_readers = {}
+_writers = {}
+_write_lock = threading.RLock()
+_local = threading.local()
+
+def _reset_after_fork():
+    # A forked report worker must not reuse its parent's connections
+    global _pool_lock, _readers, _writers, _write_lock, _local
+    _pool_lock = threading.Lock()
+    _readers = {}
+    _writers = {}
+    _write_lock = threading.RLock()
+    _local = threading.local()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_cache_mb():
+    try:
+        return max(1, int(os.getenv("DB_CACHE_MB", "64")))
+    except ValueError:
+        return 64
+
+def open_connection(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-{}".format(get_cache_mb() * 1024))
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+@contextlib.contextmanager
+def connection():
+    # For reads. Inside a transaction this is the writer connection, so the
+    # transaction's own uncommitted writes are visible; otherwise an idle
+    # connection is borrowed from the pool and handed back afterwards.
+    conn = getattr(_local, "writer", None)
+    if conn is not None:
+        yield conn
+        return
+    path = os.path.abspath(DB_PATH)
+    with _pool_lock:
+        idle = _readers.setdefault(path, [])
+        conn = idle.pop() if idle else None
+    if conn is None:
+        conn = open_connection(path)
+    try:
+        yield conn
+    finally:
+        with _pool_lock:
+            _readers.setdefault(path, []).append(conn)
+
+@contextlib.contextmanager
+def transaction():
+    # For writes. Everything done inside the outermost block is committed as
+    # one transaction, so nested calls (see batch()) share a single commit.
+    with _write_lock:
+        conn = getattr(_local, "writer", None)
+        if conn is not None:
+            yield conn
+            return
+        path = os.path.abspath(DB_PATH)
+        conn = _writers.get(path)
+        if conn is None:
+            conn = _writers[path] = open_connection(path)
+        _local.writer = conn
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _local.writer = None
+
+def batch():
+    # Groups several writes into one transaction:
+    #   with db.batch():
+    #       db.set_mark(...)
+    #       db.clear_checkpoint(...)
+    return transaction()
+
+def close():
+    # Closes the pooled connections; connections still borrowed by a reader go
+    # back to the pool when it is done and are reused from there
+    with _write_lock, _pool_lock:
+        for conn in _writers.values():
+            conn.close()
+        for idle in _readers.values():
+            for conn in idle:
+                conn.close()
+        _writers.clear()
+        _readers.clear()
 
 def create_db():
     try:
-        conn = sqlite3.connect('prisma_report.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS waas_files (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        filename TEXT,
-                        timestamp TEXT
-                        )''')
-        cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS runtime_files (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        filename TEXT,
-                        timestamp TEXT
-                        )''')
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS waas_files (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            filename TEXT,
+                            timestamp TEXT
+                            )''')
+            cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS runtime_files (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            filename TEXT,
+                            timestamp TEXT
+                            )''')
+            # Columns added after the first release are migrated in place
+            for table in ("waas_files", "runtime_files"):
+                columns = [row[1] for row in cursor.execute("PRAGMA table_info({})".format(table))]
+                for column, kind in (("dataset", "TEXT"), ("source", "TEXT"), ("last_event", "INTEGER"), ("rows", "INTEGER"),
+                                     ("size", "INTEGER"), ("first_time", "TEXT"), ("last_time", "TEXT"), ("sha256", "TEXT"), ("sheets", "TEXT")):
+                    if column not in columns:
+                        cursor.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, kind))
+            cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS fetch_marks (
+                            endpoint TEXT PRIMARY KEY,
+                            last_time TEXT,
+                            last_id TEXT
+                            )''')
+            cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS fetch_checkpoints (
+                            endpoint TEXT PRIMARY KEY,
+                            dataset TEXT,
+                            target TEXT,
+                            params TEXT,
+                            next_offset INTEGER,
+                            window_offset INTEGER,
+                            sink_bytes INTEGER,
+                            newest_time TEXT,
+                            newest_id TEXT,
+                            timestamp TEXT
+                            )''')
+            if "window_offset" not in [row[1] for row in cursor.execute("PRAGMA table_info(fetch_checkpoints)")]:
+                cursor.execute("ALTER TABLE fetch_checkpoints ADD COLUMN window_offset INTEGER")
+            for table, columns in EVENT_COLUMNS.items():
+                # Time is stored as "YYYY-MM-DD HH:MM:SS" (GMT+7) so it sorts and compares as text
+                cursor.execute("CREATE TABLE IF NOT EXISTS {} (id INTEGER PRIMARY KEY AUTOINCREMENT, report TEXT, {})".format(
+                    table, ", ".join("{} {}".format(column, "INTEGER" if column == "Port" else "TEXT") for column in columns)))
+                existing = [row[1] for row in cursor.execute("PRAGMA table_info({})".format(table))]
+                for column in ("source", "event_id"):
+                    if column not in existing:
+                        cursor.execute("ALTER TABLE {} ADD COLUMN {} TEXT".format(table, column))
+                for column in EVENT_INDEXES[table]:
+                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_{0}_{1} ON {0} ({1})".format(table, column.lower()))
+                cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_{0}_event_id ON {0} (source, event_id)".format(table))
+            # Generation of each source dataset and how many of its events are in the store
+            cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS event_sources (
+                            name TEXT PRIMARY KEY,
+                            generation INTEGER,
+                            stored_events INTEGER
+                            )''')
+            # Parquet files holding the events first stored by each run
+            cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS event_parts (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            events TEXT,
+                            source TEXT,
+                            part TEXT,
+                            report TEXT,
+                            rows INTEGER,
+                            last_event INTEGER
+                            )''')
         return None
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
-        conn.close()
         return str(e)
 
-def insert_file(filename, table, timestamp):
+def insert_file(filename, table, timestamp, dataset=None, source=None, last_event=None, rows=None, size=None, first_time=None, last_time=None, sha256=None, sheets=None):
+    # rows, size, first_time/last_time (event time range), sha256 and sheets (a
+    # JSON list of the workbook's sheets and their row counts) describe the
+    # written file so the Home page can list it without opening it
     try:
-        conn = sqlite3.connect('prisma_report.db')
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO {} (filename, timestamp) VALUES (?, ?)".format(table), (filename, timestamp))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute("INSERT INTO {} (filename, timestamp, dataset, source, last_event, rows, size, first_time, last_time, sha256, sheets) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)".format(table),
+                         (filename, timestamp, dataset, source, last_event, rows, size, first_time, last_time, sha256, sheets))
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
-    finally:
-        conn.close()
-def get_files(table):
+        if "no column named" in str(e) or "no such table" in str(e):
+            print("Database out of date, migrating...")
+            create_db()
+            return insert_file(filename, table, timestamp, dataset, source, last_event, rows, size, first_time, last_time, sha256, sheets)
+
+def get_reports(table, limit=None):
+    # Catalogue entries, oldest first, as dicts; with `limit` only the newest ones
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            query = "SELECT id, filename, timestamp, rows, size, first_time, last_time, sha256, sheets FROM {} ORDER BY id".format(table)
+            if limit is not None:
+                query = "SELECT * FROM ({} DESC LIMIT {:d}) ORDER BY id".format(query, limit)
+            return [dict(row) for row in cursor.execute(query).fetchall()]
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        if "no such table" in str(e) or "no such column" in str(e):
+            print("Database out of date, migrating...")
+            if create_db() is None:
+                return get_reports(table, limit)
+        return []
+
+def delete_file(filename, table):
+    # Returns the dataset file that is no longer needed, if any. The events a
+    # report stored stay in the store while a newer report of the same source
+    # still includes them; otherwise they are removed and the source's stored
+    # count goes back to the previous report, so the next run stores them again.
+    dataset = None
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT dataset, source, id FROM {} WHERE filename=?".format(table), (filename,))
+            row = cursor.fetchone()
+            cursor.execute("DELETE FROM {} WHERE filename=?".format(table), (filename,))
+            if row is not None and row[1] is None:
+                dataset = row[0]
+                if table in EVENT_TABLES:
+                    cursor.execute("DELETE FROM {} WHERE report=? AND source IS NULL".format(EVENT_TABLES[table]), (filename,))
+            elif row is not None:
+                cursor.execute("SELECT 1 FROM {} WHERE source=? AND id>?".format(table), (row[1], row[2]))
+                if cursor.fetchone() is None:
+                    cursor.execute("DELETE FROM {} WHERE report=? AND source=?".format(EVENT_TABLES[table]), (filename, row[1]))
+                    cursor.execute("DELETE FROM event_parts WHERE report=?", (filename,))
+                    dataset = row[0]
+                    cursor.execute("SELECT rows FROM {} WHERE source=? AND id<? ORDER BY id DESC LIMIT 1".format(table), (row[1], row[2]))
+                    previous = cursor.fetchone()
+                    name, generation = source_generation(row[1])
+                    cursor.execute("UPDATE event_sources SET stored_events=? WHERE name=? AND generation=?",
+                                   ((previous[0] or 0) if previous is not None else 0, name, generation))
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        if "no such table" in str(e):
+            print("Database out of date, migrating...")
+            if create_db() is None:
+                return delete_file(filename, table)
+    return dataset
+
+def get_mark(endpoint):
+    # Newest event (time, _id) stored for an endpoint, or None before the first run
+    try:
+        with connection() as conn:
+            return conn.execute("SELECT last_time, last_id FROM fetch_marks WHERE endpoint=?", (endpoint,)).fetchone()
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        if "no such table" in str(e):
+            print("Table not found, creating...")
+            create_db()
+            print("Tabel created successfully")
+        return None
+
+def set_mark(endpoint, last_time, last_id):
+    try:
+        with transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO fetch_marks (endpoint, last_time, last_id) VALUES (?, ?, ?)", (endpoint, last_time, last_id))
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+
+def get_checkpoint(endpoint):
+    # Last committed page of an unfinished fetch run, as a dict, or None
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            row = cursor.execute("SELECT * FROM fetch_checkpoints WHERE endpoint=?", (endpoint,)).fetchone()
+        return dict(row) if row is not None else None
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        if "no such table" in str(e):
+            print("Table not found, creating...")
+            create_db()
+            print("Tabel created successfully")
+        return None
+
+def save_checkpoint(endpoint, dataset, target, params, next_offset, sink_bytes, newest_time, newest_id, timestamp, window_offset=None):
+    # In windowed runs next_offset is the window to continue with and
+    # window_offset the page offset inside it
+    try:
+        with transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO fetch_checkpoints (endpoint, dataset, target, params, next_offset, window_offset, sink_bytes, newest_time, newest_id, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (endpoint, dataset, target, params, next_offset, window_offset, sink_bytes, newest_time, newest_id, timestamp))
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        if "no column named" in str(e):
+            print("Database out of date, migrating...")
+            create_db()
+            save_checkpoint(endpoint, dataset, target, params, next_offset, sink_bytes, newest_time, newest_id, timestamp, window_offset)
+
+def clear_checkpoint(endpoint):
+    try:
+        with transaction() as conn:
+            conn.execute("DELETE FROM fetch_checkpoints WHERE endpoint=?", (endpoint,))
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+
+def insert_events(table, source, report, keys, rows):
+    # Stores the events of `source` that are not in the store yet. rows are
+    # sequences in EVENT_COLUMNS order and keys their event ids; returns a list
+    # telling for every row whether it was new.
+    columns = EVENT_COLUMNS[table]
+    rows = list(rows)
     try:
-        conn = sqlite3.connect('prisma_report.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM {}".format(table))
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
+        with transaction() as conn:
+            cursor = conn.cursor()
+            known = set()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                cursor.execute("SELECT event_id FROM {} WHERE source=? AND event_id IN ({})".format(table, ", ".join("?" * len(chunk))), [source] + chunk)
+                known.update(row[0] for row in cursor.fetchall())
+            new = []
+            for key in keys:
+                new.append(key not in known)
+                known.add(key)
+            cursor.executemany("INSERT OR IGNORE INTO {} (source, event_id, report, {}) VALUES (?, ?, ?, {})".format(table, ", ".join(columns), ", ".join("?" * len(columns))),
+                               ([source, key, report] + list(row) for key, row, is_new in zip(keys, rows, new) if is_new))
+        return new
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        if "no such table" in str(e) or "no such column" in str(e) or "has no column" in str(e):
+            print("Database out of date, migrating...")
+            create_db()
+            return insert_events(table, source, report, keys, rows)
+        return [False] * len(keys)
+
+def generation_source(name, generation):
+    # Store source of a dataset generation; generation 0 is the store before generations
+    return "{}@{}".format(name, generation) if generation else name
+
+def source_generation(source):
+    # Inverse of generation_source(): (name, generation)
+    name, _, generation = source.rpartition("@")
+    if name and generation.isdigit():
+        return name, int(generation)
+    return source, 0
+
+def get_generation(name):
+    # (generation, number of the dataset's events already in the store)
+    try:
+        with connection() as conn:
+            row = conn.execute("SELECT generation, stored_events FROM event_sources WHERE name=?", (name,)).fetchone()
+        return tuple(row) if row is not None else (0, 0)
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
         if "no such table" in str(e):
             print("Table not found, creating...")
             create_db()
             print("Tabel created successfully")
-        conn.close()
+        return (0, 0)
+
+def start_generation(name):
+    # Called when a dataset is fetched again from scratch
+    try:
+        with transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO event_sources (name, generation, stored_events) VALUES (?, 0, 0)", (name,))
+            conn.execute("UPDATE event_sources SET generation=generation+1, stored_events=0 WHERE name=?", (name,))
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        if "no such table" in str(e):
+            print("Database out of date, migrating...")
+            create_db()
+            start_generation(name)
+
+def set_stored(name, generation, stored_events):
+    try:
+        with transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO event_sources (name, generation, stored_events) VALUES (?, ?, 0)", (name, generation))
+            conn.execute("UPDATE event_sources SET stored_events=? WHERE name=? AND generation=?", (stored_events, name, generation))
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+
+def add_part(table, source, part, report, rows):
+    # Records a run's parquet part and returns the last event id of the source
+    try:
+        with transaction() as conn:
+            last_event = conn.execute("SELECT MAX(id) FROM {} WHERE source=?".format(table), (source,)).fetchone()[0] or 0
+            conn.execute("INSERT INTO event_parts (events, source, part, report, rows, last_event) VALUES (?, ?, ?, ?, ?, ?)", (table, source, part, report, rows, last_event))
+        return last_event
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        return None
+
+def get_parts(filename, table):
+    # Parquet files making up a report: the parts of its source up to the
+    # report, or the report's own dataset for reports written before the store
+    try:
+        with connection() as conn:
+            row = conn.execute("SELECT dataset, source, last_event FROM {} WHERE filename=?".format(table), (filename,)).fetchone()
+            if row is None:
+                return []
+            if row[1] is None:
+                return [row[0]] if row[0] is not None else []
+            parts = conn.execute("SELECT part FROM event_parts WHERE events=? AND source=? AND last_event<=? AND rows>0 ORDER BY id",
+                                 (EVENT_TABLES[table], row[1], row[2])).fetchall()
+        return [part[0] for part in parts]
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
         return []
 
-def delete_file(filename, table):
+def report_scope(cursor, table, report):
+    files = [name for name, events in EVENT_TABLES.items() if events == table][0]
+    cursor.execute("SELECT source, last_event FROM {} WHERE filename=?".format(files), (report,))
+    row = cursor.fetchone()
+    if row is not None and row[0] is not None:
+        return "source=? AND id<=?", [row[0], row[1]]
+    return "report=?", [report]
+
+def event_filter(cursor, table, report, filters):
+    # filters maps a column to the values it may take; None or an empty list means any value
+    clauses = []
+    args = []
+    if report is not None:
+        clause, scope = report_scope(cursor, table, report)
+        clauses.append(clause)
+        args.extend(scope)
+    for column, values in (filters or {}).items():
+        if values:
+            clauses.append("{} IN ({})".format(column, ", ".join("?" * len(values))))
+            args.extend(values)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+def has_events(table, report):
     try:
-        conn = sqlite3.connect('prisma_report.db')
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM {} WHERE filename=?".format(table), (filename,))
-        conn.commit()
+        with connection() as conn:
+            cursor = conn.cursor()
+            where, args = event_filter(cursor, table, report, None)
+            return cursor.execute("SELECT 1 FROM {}{} LIMIT 1".format(table, where), args).fetchone() is not None
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
-    finally:
-        conn.close()
\ No newline at end of file
+        return False
+
+def count_events(table, column, report=None, filters=None, limit=5, distinct=None):
+    # Top `limit` values of a column by number of events, or by number of
+    # distinct values of another column, as (value, count) pairs
+    count = "COUNT(DISTINCT {})".format(distinct) if distinct else "COUNT(*)"
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            where, args = event_filter(cursor, table, report, filters)
+            cursor.execute("SELECT {0}, {1} AS n FROM {2}{3} GROUP BY {0} ORDER BY n DESC, MIN(id) LIMIT ?".format(column, count, table, where), args + [limit])
+            return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        return []
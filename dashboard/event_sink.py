@@ -0,0 +1,58 @@
+import gzip, hashlib, json, os
+
+
+def compress_enabled():
+    return os.getenv("COMPRESS_DATASETS", "false").lower() in ("1", "true", "yes")
+
+def dataset_path(name):
+    # "result_data_waas" -> "result_data_waas.ndjson" or "result_data_waas.ndjson.gz"
+    return "{}.ndjson{}".format(name, ".gz" if compress_enabled() else "")
+
+def source_name(path):
+    # "result_data_waas_1a2b3c4d.ndjson.gz" -> "result_data_waas_1a2b3c4d"
+    return os.path.basename(path).split(".")[0]
+
+def event_key(event):
+    # The console's audit id, or a hash of the event's content when it has none
+    if event.get("_id"):
+        return event["_id"]
+    return "sha1:" + hashlib.sha1(json.dumps(event, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class EventSink:
+    # Append-only NDJSON file that fetched pages are streamed into. Compressed
+    # sinks write every page as its own gzip member, so the file can be appended
+    # to (and truncated back to a page boundary) like the plain one.
+    def __init__(self, path, mode="ab", compress=None):
+        self.path = path
+        self.compress = path.endswith(".gz") if compress is None else compress
+        self.file = open(path, mode)
+        self.count = 0
+
+    def write_page(self, events):
+        data = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events).encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data)
+        self.file.write(data)
+        self.file.flush()
+        self.count += len(events)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_events(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,85 @@
+import os
+import xlsxwriter
+
+# Excel holds 1,048,576 rows per sheet, one of which is the header
+EXCEL_MAX_ROWS = 1048575
+
+HEADER_FORMAT = {
+    'bold': True,
+    'bg_color': '#0070C0',
+    'border': 1,
+    'font_color': '#ffffff'
+}
+CELL_FORMAT = {
+    'border': 1,
+    'align': 'left',
+    'valign': 'top'
+}
+
+def get_max_rows():
+    try:
+        return min(max(1, int(os.getenv("EXCEL_MAX_ROWS", EXCEL_MAX_ROWS))), EXCEL_MAX_ROWS)
+    except ValueError:
+        return EXCEL_MAX_ROWS
+
+
+class TableWriter:
+    # Writes a report table row by row into a constant_memory workbook, so
+    # each row is flushed to disk as soon as the next one starts and memory
+    # stays flat however many rows are written. Column widths are tracked
+    # while streaming and applied when a sheet is finished.
+    # A sheet that reaches `max_rows` rows is continued on "<sheet_name> (2)",
+    # "<sheet_name> (3)" and so on, each with its own header and widths.
+    def __init__(self, filepath, sheet_name, columns, padding=2, max_rows=None):
+        self.filepath = filepath
+        self.sheet_name = sheet_name
+        self.columns = columns
+        self.padding = padding
+        self.max_rows = max_rows or get_max_rows()
+        self.workbook = xlsxwriter.Workbook(filepath, {'strings_to_urls': False, 'constant_memory': True})
+        self.header_format = self.workbook.add_format(HEADER_FORMAT)
+        self.cell_format = self.workbook.add_format(CELL_FORMAT)
+        self.sheets = []
+        self.rows = 0
+        self.add_sheet()
+
+    def add_sheet(self):
+        name = self.sheet_name if not self.sheets else "{} ({})".format(self.sheet_name, len(self.sheets) + 1)
+        self.worksheet = self.workbook.add_worksheet(name)
+        self.worksheet.write_row(0, 0, self.columns, self.header_format)
+        self.widths = [len(column) for column in self.columns]
+        self.row = 1
+        self.sheets.append({"sheet": name, "rows": 0})
+
+    def finish_sheet(self):
+        for col, width in enumerate(self.widths):
+            self.worksheet.set_column(col, col, width + self.padding)
+
+    def write_row(self, values):
+        if self.row > self.max_rows:
+            self.finish_sheet()
+            self.add_sheet()
+        self.worksheet.write_row(self.row, 0, values, cell_format=self.cell_format)
+        widths = self.widths
+        for col, value in enumerate(values):
+            if value is not None:
+                length = len(value) if isinstance(value, str) else len(str(value))
+                if length > widths[col]:
+                    widths[col] = length
+        self.row += 1
+        self.rows += 1
+        self.sheets[-1]["rows"] += 1
+
+    def write_rows(self, rows):
+        for values in rows:
+            self.write_row(values)
+
+    def close(self):
+        self.finish_sheet()
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
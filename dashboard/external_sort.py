@@ -0,0 +1,55 @@
+import heapq, os, pickle, tempfile
+
+# Records are pickled in chunks, one pickle call per chunk rather than per record
+CHUNK_ROWS = 1000
+
+
+def get_run_rows():
+    try:
+        return max(1, int(os.getenv("SORT_RUN_ROWS", "200000")))
+    except ValueError:
+        return 200000
+
+
+def write_run(path, records):
+    with open(path, "wb") as f:
+        for start in range(0, len(records), CHUNK_ROWS):
+            pickle.dump(records[start:start + CHUNK_ROWS], f, pickle.HIGHEST_PROTOCOL)
+
+
+def read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def external_sort(records, run_rows=None):
+    # Sorts tuples while holding at most `run_rows` of them in memory: every
+    # full run is sorted and spilled to a temporary file, and the runs are then
+    # k-way merged back, one chunk per run in memory at a time. Input that fits
+    # in a single run is sorted in memory without touching the disk.
+    run_rows = run_rows or get_run_rows()
+    with tempfile.TemporaryDirectory(prefix="prisma-sort-") as directory:
+        paths = []
+        run = []
+        for record in records:
+            run.append(record)
+            if len(run) >= run_rows:
+                run.sort()
+                paths.append(os.path.join(directory, "run{}.pickle".format(len(paths))))
+                write_run(paths[-1], run)
+                run = []
+        run.sort()
+        if not paths:
+            yield from run
+            return
+        if run:
+            paths.append(os.path.join(directory, "run{}.pickle".format(len(paths))))
+            write_run(paths[-1], run)
+        run = None
+        print("Merging {} sorted runs".format(len(paths)))
+        yield from heapq.merge(*(read_run(path) for path in paths))
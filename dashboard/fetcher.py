@@ -0,0 +1,216 @@
+import requests, os, datetime, json, hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+PAGE_SIZE = 100
+
+
+class FetchError(Exception):
+    def __init__(self, status_code, url, text=""):
+        super().__init__("Request to {} failed with status {}".format(url, status_code))
+        self.status_code = status_code
+        self.url = url
+        self.text = text
+
+
+def get_workers():
+    # Number of page requests kept in flight, configurable through FETCH_WORKERS
+    try:
+        return max(1, int(os.getenv("FETCH_WORKERS", "4")))
+    except ValueError:
+        return 4
+
+
+def fetch_page(client, path, offset, page_size=PAGE_SIZE, params=None):
+    page_params = dict(params or {})
+    page_params["limit"] = page_size
+    page_params["offset"] = offset
+
+    # Rate limiting and retries are handled by the console client
+    try:
+        response = client.get(path, params=page_params)
+    except requests.RequestException as e:
+        print(e)
+        raise FetchError("Connection error", client.url(path), str(e))
+    print("Response Code: {}".format(response.status_code))
+    if response.status_code != 200:
+        print(response.url)
+        print(response.text)
+        raise FetchError(response.status_code, response.url, response.text)
+    return response.json() or []
+
+
+def fetch_pages(client, path, page_size=PAGE_SIZE, params=None, workers=None, start_offset=0):
+    # Keeps `workers` offset-paginated requests in flight and yields (offset, events)
+    # in offset order, stopping at the first empty page like the serial loop did.
+    workers = workers or get_workers()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = {}
+    next_offset = start_offset
+    expected = start_offset
+    try:
+        while True:
+            while len(pending) < workers:
+                pending[next_offset] = pool.submit(fetch_page, client, path, next_offset, page_size, params)
+                next_offset += page_size
+            events = pending.pop(expected).result()
+            if not events:
+                print("\nAll events have been fetched!\n")
+                return
+            yield expected, events
+            expected += page_size
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def get_window_hours():
+    # Width of each time window in FETCH_MODE=windows, configurable through FETCH_WINDOW_HOURS
+    try:
+        return max(1, int(os.getenv("FETCH_WINDOW_HOURS", "24")))
+    except ValueError:
+        return 24
+
+
+def format_time(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def time_windows(start, end, window_hours):
+    # Splits [start, end) into consecutive "from"/"to" filters
+    windows = []
+    step = datetime.timedelta(hours=window_hours)
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + step, end)
+        windows.append((format_time(window_start), format_time(window_end)))
+        window_start = window_end
+    return windows
+
+
+def fetch_windows(client, path, windows, page_size=PAGE_SIZE, params=None, workers=None, start_index=0, start_offset=0):
+    # Keeps up to `workers` page requests in flight across several windows and
+    # yields (index, offset, events) in window and offset order, so every page
+    # can be checkpointed and memory depends on the page size only. A window
+    # asks for its next page once the previous one came back, and fans out
+    # further ahead only after a full page; it ends at its first empty page.
+    workers = workers or get_workers()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = {}
+    last = {}       # window -> offset of the last page requested
+    last_size = {}  # window -> size of its last page already yielded
+    full = set()    # windows that returned a full page
+    index, offset = start_index, start_offset
+    fetched = 0
+
+    def submit(window, page_offset):
+        window_params = dict(params or {})
+        window_params["from"], window_params["to"] = windows[window]
+        pending[(window, page_offset)] = pool.submit(fetch_page, client, path, page_offset, page_size, window_params)
+        last[window] = page_offset
+
+    def schedule():
+        for window in range(index, len(windows)):
+            if len(pending) >= workers:
+                return
+            if window not in last:
+                submit(window, start_offset if window == start_index else 0)
+                continue
+            future = pending.get((window, last[window]))
+            if future is None:
+                size = last_size[window]
+            elif future.done():
+                size = len(future.result())
+            else:
+                size = None
+            if size == page_size:
+                full.add(window)
+            if size or (size is None and window in full):
+                submit(window, last[window] + page_size)
+
+    try:
+        while index < len(windows):
+            if (index, offset) not in pending:
+                # The page yielded next is always requested, even over the budget
+                submit(index, offset)
+            schedule()
+            if not pending[(index, offset)].done():
+                wait([future for future in pending.values() if not future.done()], return_when=FIRST_COMPLETED)
+                continue
+            events = pending.pop((index, offset)).result()
+            if events:
+                fetched += len(events)
+                last_size[index] = len(events)
+                yield index, offset, events
+                offset += page_size
+                continue
+            print("Fetched {} events between {} and {}".format(fetched, *windows[index]))
+            for key in [key for key in pending if key[0] == index]:
+                pending.pop(key).cancel()
+            index, offset, fetched = index + 1, 0, 0
+        print("\nAll events have been fetched!\n")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def windowed_mode():
+    return os.getenv("FETCH_MODE", "offset").lower() == "windows"
+
+
+def get_window_days():
+    # How far back a full run reaches in FETCH_MODE=windows, configurable through FETCH_WINDOW_DAYS
+    try:
+        return max(1, int(os.getenv("FETCH_WINDOW_DAYS", "30")))
+    except ValueError:
+        return 30
+
+
+# Report-level filter keys and the query parameter each audit endpoint expects for them
+FILTER_PARAMS = {
+    "/api/v1/audits/runtime/container": {
+        "collections": "collections",
+        "clusters": "cluster",
+        "namespaces": "namespace",
+        "attack_types": "attackType",
+    },
+    "/api/v33.01/audits/firewall/app/container": {
+        "collections": "collections",
+        "clusters": "cluster",
+        "namespaces": "ns",
+        "attack_types": "type",
+    },
+}
+
+
+def load_filters(name):
+    # Filter spec from a JSON environment variable, e.g.
+    # RUNTIME_FILTERS='{"from": "2024-11-01T00:00:00Z", "clusters": ["prod"]}'
+    try:
+        return json.loads(os.getenv(name) or "{}")
+    except ValueError:
+        print("Ignoring invalid {}".format(name))
+        return {}
+
+
+def filter_params(path, filters=None, fields=None):
+    filters = filters or {}
+    params = {}
+    for key in ("from", "to"):
+        if filters.get(key):
+            params[key] = filters[key]
+    for key, param in FILTER_PARAMS.get(path, {}).items():
+        value = filters.get(key)
+        if value:
+            params[param] = ",".join(value) if isinstance(value, (list, tuple)) else value
+    if fields:
+        params["fields"] = ",".join(fields)
+    return params
+
+
+def filter_suffix(filters=None):
+    # Filtered pulls get their own dataset, mark and checkpoint
+    if not filters:
+        return ""
+    return "_" + hashlib.sha1(json.dumps(filters, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+
+def project(event, fields):
+    return {field: event[field] for field in fields if field in event}
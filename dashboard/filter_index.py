@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+# Columns with at most this many distinct values get a precomputed bitmap per
+# value; wider ones (paths, hosts) build their bitmap from the codes when asked.
+BITMAP_MAX_VALUES = 256
+
+
+class FilterIndex:
+    # The sidebar dimensions of a report, each factorized once into integer
+    # codes (values in first-seen order, NaN included) with a packed bitmap per
+    # value. A selection is answered with bitwise OR over the chosen values of a
+    # column and AND across columns, so cascading options and the final row
+    # mask never compare strings again.
+    def __init__(self, df, columns):
+        self.rows = len(df)
+        self.codes = {}
+        self.values = {}
+        self.bitmaps = {}
+        for column in columns:
+            codes, values = pd.factorize(df[column], use_na_sentinel=False)
+            self.codes[column] = codes.astype(np.int32)
+            self.values[column] = values
+            if len(values) <= BITMAP_MAX_VALUES:
+                self.bitmaps[column] = np.array([np.packbits(codes == code) for code in range(len(values))], dtype=np.uint8).reshape(len(values), -1)
+        self.nbytes = sum(codes.nbytes for codes in self.codes.values()) + sum(bitmaps.nbytes for bitmaps in self.bitmaps.values())
+
+    def value_codes(self, column, chosen):
+        values = self.values[column]
+        codes = pd.Index(values).get_indexer(pd.Index(chosen).dropna())
+        codes = codes[codes >= 0]
+        if pd.isna(pd.Index(chosen)).any():
+            codes = np.append(codes, np.flatnonzero(pd.isna(values)))
+        return codes
+
+    def column_bitmap(self, column, chosen):
+        codes = self.value_codes(column, chosen)
+        if column in self.bitmaps:
+            if len(codes) == 0:
+                return np.zeros(self.bitmaps[column].shape[1], dtype=np.uint8)
+            return np.bitwise_or.reduce(self.bitmaps[column][codes], axis=0)
+        lookup = np.zeros(len(self.values[column]), dtype=bool)
+        lookup[codes] = True
+        return np.packbits(lookup[self.codes[column]])
+
+    def bitmap(self, selection):
+        # Packed bitmap of the rows matching `selection`, {column: values}; a
+        # column left out or given None is not filtered
+        result = None
+        for column, chosen in selection.items():
+            if chosen is None:
+                continue
+            bitmap = self.column_bitmap(column, chosen)
+            result = bitmap if result is None else result & bitmap
+        return result
+
+    def mask(self, selection):
+        bitmap = self.bitmap(selection)
+        if bitmap is None:
+            return np.ones(self.rows, dtype=bool)
+        return np.unpackbits(bitmap, count=self.rows).view(bool)
+
+    def options(self, column, selection=None):
+        # Values of `column` on the matching rows, in first-seen order like pandas' unique()
+        bitmap = self.bitmap(selection or {})
+        if bitmap is None:
+            return self.values[column].tolist()
+        codes = self.codes[column][np.unpackbits(bitmap, count=self.rows).view(bool)]
+        return self.values[column].take(pd.unique(codes)).tolist()
@@ -2,28 +2,61 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import timedelta, datetime
-import export_pdf
+from datetime import datetime
+import export_pdf, db, dataset_cache, aggregates, filter_index
 import urllib.parse, os
 
 st.set_page_config(page_title='Prisma Cloud Report Dashboard', page_icon=':bar_chart:', layout='wide')
 if st.button("Clear Cache"):
     st.cache_data.clear()
+    dataset_cache.clear()
 
 if "filename" in st.query_params:
     filename = st.query_params["filename"]
     
     if os.path.exists(filename):
-        # @st.cache_data
-        def load_data():
-
-            df = pd.read_excel(
-                io=filename,
-                engine='openpyxl',
-            )
+        def read_dataset(paths):
+            # Reports generated with Parquet datasets load from the parts of
+            # the event store they cover; the .xlsx is only read for reports
+            # created before datasets were written.
+            if paths[0].endswith(".parquet"):
+                df = pd.concat([pd.read_parquet(part) for part in paths], ignore_index=True)
+            else:
+                # Large reports continue on numbered sheets, read them all
+                sheets = pd.read_excel(
+                    io=filename,
+                    engine='openpyxl',
+                    sheet_name=None,
+                )
+                df = pd.concat(sheets.values(), ignore_index=True)
             df.index += 1
             return df
 
+        def load_data():
+            # Read and indexed once per process, shared by all sessions until the files change
+            paths = [part for part in db.get_parts(filename, "waas_files") if os.path.exists(part)] or [filename]
+            df = dataset_cache.load(paths, read_dataset)
+            row_index = dataset_cache.load(paths, lambda paths: filter_index.FilterIndex(df, ["AttackType", "Image", "Namespace", "Host", "Path"]), kind="filters")
+            return df, row_index
+
+        # Reports written with indexed events get their filtered top-5 counts
+        # from SQLite instead of scanning the DataFrame
+        indexed = db.has_events("waas_events", filename)
+
+        # Chart inputs of the unfiltered view, written with the report
+        sidecar = aggregates.load_sidecar(filename)
+
+        def selected(choice):
+            return None if not choice or "Select All" in choice else choice
+
+        def unfiltered(*choices):
+            return all(selected(choice) is None for choice in choices)
+
+        def top_events(column, filters=None, distinct=None):
+            rows = db.count_events("waas_events", column, filename, filters, distinct=distinct)
+            counts = pd.Series([count for _, count in rows], index=pd.Index([value for value, _ in rows], name=column), name="count")
+            return counts.sort_values(ascending=True)
+
         # --- SIDEBAR ---
         st.sidebar.header("Filter")
         # url = st.sidebar.multiselect(
@@ -33,10 +66,10 @@ if "filename" in st.query_params:
         # )
         # Get unique values and add "Select All" option
 
-        def process_data(df):
-            attack_type_options = df["AttackType"].unique().tolist()
-            image_options = df["Image"].unique().tolist() 
-            namespace_options = df["Namespace"].unique().tolist()
+        def process_data(df, row_index):
+            attack_type_options = row_index.options("AttackType")
+            image_options = row_index.options("Image")
+            namespace_options = row_index.options("Namespace")
                       
             all_option = "Select All"
             attack_type_choices = [all_option] + attack_type_options
@@ -49,26 +82,29 @@ if "filename" in st.query_params:
                 default=[]
             )
 
-            attack_type_condition = attack_type_options if all_option in attack_type or not attack_type else attack_type
-            # image_condition = image_options if all_option in image or not image else image
-            namespace_condition = namespace_options if all_option in namespace or not namespace else namespace
-
             
             
-            image_attack_counts = df["Image"].value_counts().head(5).sort_values(ascending=True)
+            if sidecar is not None:
+                image_attack_counts = aggregates.to_series(sidecar["counts"]["Image"], "Image", "count").sort_values(ascending=True)
+            elif indexed:
+                image_attack_counts = top_events("Image")
+            else:
+                image_attack_counts = df["Image"].value_counts().head(5).sort_values(ascending=True)
             
             ## Filter by Image->URL->Path
             # if image_condition != image_options:
-            filtered_by_image = df[df["Namespace"].isin(namespace_condition)]
-            host_options = filtered_by_image["Host"].unique().tolist()
+            selection = {"Namespace": selected(namespace)}
+            host_options = row_index.options("Host", selection)
             host = st.sidebar.multiselect("Host:", options=[all_option] + host_options, default=[])
-            host_condition = host_options if all_option in host or not host else host
             
-            filtered_by_host = filtered_by_image[filtered_by_image["Host"].isin(host_condition)]
-            path_options = filtered_by_host["Path"].unique().tolist()
+            selection["Host"] = selected(host)
+            path_options = row_index.options("Path", selection)
             path = st.sidebar.multiselect("Path:", options=[all_option] + path_options, default=[])
-            path_condition = path_options if all_option in path or not path else path
             
+            selection["Path"] = selected(path)
+            selection["AttackType"] = selected(attack_type)
+            df_selection = df[row_index.mask(selection)]
+
             # Check if filters are applied
             filters = {
                 "Attack Type": attack_type if attack_type else "All",
@@ -77,28 +113,44 @@ if "filename" in st.query_params:
                 "Path": path if path else "All",
             }   
             
-            # df_selection = df_selection.query("Host in @host_condition and Path in @path_condition")
-            df_selection = df.query(
-                "Namespace in @namespace_condition and Host in @host_condition and Path in @path_condition and AttackType in @attack_type_condition"
-            )
             if df_selection.empty:
                 st.warning("No data available for the selected filters. Please adjust your filters.")
                 return None, None, None, None, None, None, None, None, None, None, None, None, None, None
-            host_counts = df_selection["Host"].value_counts().nlargest(5).sort_values(ascending=True)
-            
-            
-            #DF SELECTION
-            attack_counts = df_selection["AttackType"].value_counts().nlargest(5).sort_values(ascending=True)
-            filtered_attack = df_selection[df_selection["Effect"].isin(["alert","ban","prevent"])]
-            filtered_attack_count = filtered_attack["AttackType"].value_counts().nlargest(5).sort_values(ascending=True)
-            attacker_ip = df_selection["IPAddress"].value_counts().nlargest(5).sort_values(ascending=True)
+            use_sidecar = sidecar is not None and unfiltered(namespace, host, path, attack_type)
+            if use_sidecar:
+                # Nothing is filtered, so the counts written with the report apply
+                counts = sidecar["counts"]
+                host_counts = aggregates.to_series(counts["Host"], "Host", "count").sort_values(ascending=True)
+                attack_counts = aggregates.to_series(counts["AttackType"], "AttackType", "count").sort_values(ascending=True)
+                filtered_attack_count = aggregates.to_series(counts["BlockedAttackType"], "AttackType", "count").sort_values(ascending=True)
+                attacker_ip = aggregates.to_series(counts["IPAddress"], "IPAddress", "count").sort_values(ascending=True)
+            elif indexed:
+                # Top-5 counts are aggregated by SQLite over the indexed events
+                host_counts = top_events("Host", selection)
+                attack_counts = top_events("AttackType", selection)
+                filtered_attack_count = top_events("AttackType", dict(selection, Effect=["alert", "ban", "prevent"]))
+                attacker_ip = top_events("IPAddress", selection)
+            else:
+                host_counts = df_selection["Host"].value_counts().nlargest(5).sort_values(ascending=True)
+
+                #DF SELECTION
+                attack_counts = df_selection["AttackType"].value_counts().nlargest(5).sort_values(ascending=True)
+                filtered_attack = df_selection[df_selection["Effect"].isin(["alert","ban","prevent"])]
+                filtered_attack_count = filtered_attack["AttackType"].value_counts().nlargest(5).sort_values(ascending=True)
+                attacker_ip = df_selection["IPAddress"].value_counts().nlargest(5).sort_values(ascending=True)
             
-            unique_attack_counts = df_selection.groupby('Host')['AttackType'].nunique()
+            if use_sidecar:
+                unique_attack_counts = aggregates.to_series(sidecar["distinct"]["Host"], "Host", "AttackType")
+            else:
+                unique_attack_counts = df_selection.groupby('Host')['AttackType'].nunique()
             
             if not unique_attack_counts.empty:
                 max_unique_attacks_host = unique_attack_counts.idxmax()
                 max_unique_attacks_count = unique_attack_counts.max()
-                top_5_host_unique_attacks = unique_attack_counts.nlargest(5).sort_values(ascending=True)
+                if indexed and not use_sidecar:
+                    top_5_host_unique_attacks = top_events("Host", selection, distinct="AttackType")
+                else:
+                    top_5_host_unique_attacks = unique_attack_counts.nlargest(5).sort_values(ascending=True)
                 max_unique_attacks_host = unique_attack_counts.idxmax()
                 max_unique_attacks_count = unique_attack_counts.max()
             else:
@@ -109,17 +161,10 @@ if "filename" in st.query_params:
             
             if not pd.api.types.is_datetime64_any_dtype(df_selection['Time']):
                 df_selection['Time'] = pd.to_datetime(df_selection['Time'], format="%d-%m-%Y %H:%M:%S")
-            end_time = df_selection['Time'].max()
-            start_time = end_time - timedelta(days=3)
-            df_last_3_days = df_selection[(df_selection["Time"] >= start_time) & (df_selection["Time"] <= end_time)]
-            
-            if not df_last_3_days.empty:
-                attack_time = df_last_3_days.groupby([df_selection['Time'].dt.floor('h'), 'AttackType']).size().reset_index(name='Count')
-                attack_time.set_index(['Time', 'AttackType'], inplace=True)
-                attack_time = attack_time.unstack().resample('15min').interpolate('linear').stack().reset_index()
-                attack_time['Count'] = attack_time['Count'].round().astype(int)
+            if use_sidecar:
+                attack_time = aggregates.time_frame(sidecar["time"])
             else:
-                attack_time = pd.DataFrame(columns=['Time', 'AttackType', 'Count'])           
+                attack_time = aggregates.attack_time_series(df_selection)
                 
             
             return (filters, image_attack_counts, top_5_host_unique_attacks, max_unique_attacks_host, max_unique_attacks_count,
@@ -139,9 +184,9 @@ if "filename" in st.query_params:
             
         )
 
-        df = load_data()
+        df, row_index = load_data()
         
-        filters, images, top_5_host_unique_attacks, max_unique_attacks_url,max_unique_attacks_count, unique_attack_counts, df_selection, host_counts, attack_counts, filtered_attack_count, attacker_ip, attack_time, attack_type_choices, image_choices = process_data(df)
+        filters, images, top_5_host_unique_attacks, max_unique_attacks_url,max_unique_attacks_count, unique_attack_counts, df_selection, host_counts, attack_counts, filtered_attack_count, attacker_ip, attack_time, attack_type_choices, image_choices = process_data(df, row_index)
         # def plot_chart_top_url_distinct_attack(url_distinct):
         
             
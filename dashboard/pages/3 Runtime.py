@@ -3,7 +3,7 @@ import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import timedelta, datetime
-import export_pdf
+import export_pdf, db, dataset_cache, aggregates, filter_index
 import urllib.parse, os
 from openpyxl import load_workbook
 from openpyxl.styles import Alignment
@@ -12,82 +12,86 @@ from openpyxl.styles import Alignment
 st.set_page_config(page_title='Prisma Cloud Report Dashboard', page_icon=':bar_chart:', layout='wide')
 if st.button("Clear Cache"):
     st.cache_data.clear()
+    dataset_cache.clear()
 
 if "filename" in st.query_params:
     filename = st.query_params["filename"]
     
     if os.path.exists(filename):
-        # @st.cache_data
-        def load_data():
-
-            df = pd.read_excel(
-                io=filename,
-                engine='openpyxl',
-            )
+        def read_dataset(paths):
+            # Reports generated with Parquet datasets load from the parts of
+            # the event store they cover; the .xlsx is only read for reports
+            # created before datasets were written.
+            if paths[0].endswith(".parquet"):
+                df = pd.concat([pd.read_parquet(part) for part in paths], ignore_index=True)
+            else:
+                # Large reports continue on numbered sheets, read them all
+                sheets = pd.read_excel(
+                    io=filename,
+                    engine='openpyxl',
+                    sheet_name=None,
+                )
+                df = pd.concat(sheets.values(), ignore_index=True)
             df.index += 1
             return df
 
-        def process_data(df):
+        def load_data():
+            # Read and indexed once per process, shared by all sessions until the files change
+            paths = [part for part in db.get_parts(filename, "runtime_files") if os.path.exists(part)] or [filename]
+            df = dataset_cache.load(paths, read_dataset)
+            row_index = dataset_cache.load(paths, lambda paths: filter_index.FilterIndex(df, ["AttackType", "Namespace", "Cluster", "containerName"]), kind="filters")
+            return df, row_index
+
+        # Chart inputs of the unfiltered view, written with the report
+        sidecar = aggregates.load_sidecar(filename)
+
+        def selected(choice):
+            return None if not choice or "Select All" in choice else choice
+
+        def unfiltered(*choices):
+            return all(selected(choice) is None for choice in choices)
+
+        def top_events(column, name, filters=None, distinct=None):
+            rows = db.count_events("runtime_events", column, filename, filters, distinct=distinct)
+            return pd.DataFrame(rows, columns=[column, name]).sort_values(by=name, ascending=True)
+
+        def process_data(df, row_index):
             # Unique values for filtering
-            attack_type_options = df["AttackType"].unique().tolist()
-            namespace_options = df["Namespace"].unique().tolist()
-            cluster_options = df["Cluster"].unique().tolist()
-            container_options = df["containerName"].unique().tolist()
+            attack_type_options = row_index.options("AttackType")
 
             # 'Select All' option
             all_option = "Select All"
             attack_type_choices = [all_option] + attack_type_options
-            namespace_choices = [all_option] + namespace_options
-            cluster_choices = [all_option] + cluster_options
-            container_choices = [all_option] + container_options
 
             # Sidebar filter for AttackType
             attack_type = st.sidebar.multiselect("AttackType:", options=attack_type_choices, default=[], key="attack_type_filter")
 
-            # Apply 'Select All' logic for AttackType
-            attack_type_condition = attack_type_options if all_option in attack_type or not attack_type else attack_type
-
             # Step 1: Filter by AttackType to dynamically update Namespace options
-            if attack_type:
-                filtered_namespaces = df[df["AttackType"].isin(attack_type_condition)]["Namespace"].unique().tolist()
-            else:
-                filtered_namespaces = namespace_options
+            selection = {"AttackType": selected(attack_type)}
+            filtered_namespaces = row_index.options("Namespace", selection)
 
             # Update Namespace options
             namespace_choices = [all_option] + filtered_namespaces
             namespace = st.sidebar.multiselect("Namespace:", options=namespace_choices, default=[], key="namespace_filter")
 
-            # Apply 'Select All' logic for Namespace
-            namespace_condition = namespace_options if all_option in namespace or not namespace else namespace
-
             # Step 2: Filter by both AttackType and Namespace to dynamically update Cluster options
-            filtered_df = df[
-                (df["AttackType"].isin(attack_type_condition)) & 
-                (df["Namespace"].isin(namespace_condition))
-            ]
-            filtered_clusters = filtered_df["Cluster"].unique().tolist()
+            selection["Namespace"] = selected(namespace)
+            filtered_clusters = row_index.options("Cluster", selection)
 
             # Update Cluster options
             cluster_choices = [all_option] + filtered_clusters
             cluster = st.sidebar.multiselect("Cluster:", options=cluster_choices, default=[], key="cluster_filter")
 
-            # Apply 'Select All' logic for Cluster
-            cluster_condition = cluster_options if all_option in cluster or not cluster else cluster
-
-            filtered_df = filtered_df[(filtered_df["Cluster"].isin(cluster_condition))]
-            filtered_containers = filtered_df["containerName"].unique().tolist()
+            selection["Cluster"] = selected(cluster)
+            filtered_containers = row_index.options("containerName", selection)
 
             # Update Container options
             container_choices = [all_option] + filtered_containers
             container = st.sidebar.multiselect("Container:", options=container_choices, default=[], key="container_filter")
 
-            # Apply 'Select All' logic for Container
-            container_condition = container_options if all_option in container or not container else container
-
             # Final selection: Filter the dataframe based on the selected conditions
-            df_selection = df.query(
-                 "AttackType in @attack_type_condition and Namespace in @namespace_condition and Cluster in @cluster_condition and containerName in @container_condition"
-            )
+            selection["containerName"] = selected(container)
+            df_selection = df[row_index.mask(selection)]
             filters = {
                 "Attack Type": attack_type if attack_type else "All",
                 "Namespace": namespace if namespace else "All",
@@ -96,17 +100,34 @@ if "filename" in st.query_params:
             if df_selection.empty:
                 st.warning("No data available for the selected filters. Please adjust your filters.")
                 return None
+            use_sidecar = sidecar is not None and unfiltered(attack_type, namespace, cluster, container)
+            if indexed and not use_sidecar:
+                # Top-5 counts are aggregated by SQLite over the indexed events
+                cluster_attack_counts = top_events("Cluster", "UniqueAttackTypes", selection, distinct="AttackType")
+                container_unique_attack_counts = top_events("containerName", "UniqueAttackTypes", selection, distinct="AttackType").rename(columns={"containerName": "Container"})
+                container_attack_counts = top_events("containerName", "TotalAttacks", selection).rename(columns={"containerName": "Container"})
+                attack_type_counts = top_events("AttackType", "TotalOccurrences", selection).iloc[::-1].reset_index(drop=True)
+                return df_selection, cluster_attack_counts, container_unique_attack_counts, container_attack_counts, attack_type_counts, filters
+            if use_sidecar:
+                # Nothing is filtered, so the tables written with the report apply
+                cluster_unique = aggregates.to_series(sidecar["distinct"]["Cluster"], "Cluster", "AttackType")
+                container_unique = aggregates.to_series(sidecar["distinct"]["containerName"], "containerName", "AttackType")
+                container_total = aggregates.to_series(sidecar["counts"]["containerName"], "containerName", "AttackType")
+                attack_type_total = aggregates.to_series(sidecar["counts"]["AttackType"], "AttackType", "count")
+            else:
+                cluster_unique = df_selection.groupby("Cluster")["AttackType"].nunique()
+                container_unique = df_selection.groupby("containerName")["AttackType"].nunique()
+                container_total = df_selection.groupby("containerName")["AttackType"].count()
+                attack_type_total = df_selection["AttackType"].value_counts()
             cluster_attack_counts = (
-            df_selection.groupby("Cluster")["AttackType"]
-                .nunique()
+            cluster_unique
                 .sort_values(ascending=False)
                 .head(5)
                 .reset_index(name="UniqueAttackTypes")
                 .sort_values(by="UniqueAttackTypes", ascending=True)
             )
             container_unique_attack_counts = (
-                df_selection.groupby("containerName")["AttackType"]
-                .nunique()
+                container_unique
                 .sort_values(ascending=False)
                 .head(5)
                 .reset_index()
@@ -114,8 +135,7 @@ if "filename" in st.query_params:
                 .sort_values(by="UniqueAttackTypes", ascending=True)
             )
             container_attack_counts = (
-                df_selection.groupby("containerName")["AttackType"]
-                .count()
+                container_total
                 .sort_values(ascending=False)
                 .head(5)
                 .reset_index()
@@ -123,8 +143,7 @@ if "filename" in st.query_params:
                 .sort_values(by="TotalAttacks", ascending=True)
             )
             attack_type_counts = (
-                df_selection["AttackType"]
-                .value_counts()
+                attack_type_total
                 .head(5)
                 .reset_index()
                 .rename(columns={"index": "AttackType", "count": "TotalOccurrences"})
@@ -288,8 +307,11 @@ if "filename" in st.query_params:
             
         # --- SIDEBAR ---
         st.sidebar.header("Filter")
-        df = load_data()
-        df_selection, cluster_attack_counts, container_unique_attack_counts, container_attack_counts, attack_type_counts, filters = process_data(df)
+        df, row_index = load_data()
+        # Reports written with indexed events get their filtered top-5 counts
+        # from SQLite instead of scanning the DataFrame
+        indexed = db.has_events("runtime_events", filename)
+        df_selection, cluster_attack_counts, container_unique_attack_counts, container_attack_counts, attack_type_counts, filters = process_data(df, row_index)
         # url = st.sidebar.multiselect(
         #     "Select URL:",
         #     options=df["URL"].unique(),
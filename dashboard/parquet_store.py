@@ -0,0 +1,113 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Normalized report rows, stored next to each workbook so the dashboard can load
+# them without parsing the .xlsx. Column names match the Excel headers.
+WAAS_SCHEMA = pa.schema([
+    ("Host", pa.string()),
+    ("URL", pa.string()),
+    ("Time", pa.timestamp("s")),
+    ("Namespace", pa.string()),
+    ("AttackType", pa.string()),
+    ("APIEndpoint", pa.string()),
+    ("IPAddress", pa.string()),
+    ("Path", pa.string()),
+    ("Image", pa.string()),
+    ("Effect", pa.string()),
+])
+WAAS_TIME_FORMAT = "%d-%m-%Y %H:%M:%S"
+
+RUNTIME_SCHEMA = pa.schema([
+    ("containerName", pa.string()),
+    ("Cluster", pa.string()),
+    ("imageName", pa.string()),
+    ("Hostname", pa.string()),
+    ("Time", pa.timestamp("s")),
+    ("Port", pa.int64()),
+    ("Path", pa.string()),
+    ("Command", pa.string()),
+    ("Namespace", pa.string()),
+    ("AttackType", pa.string()),
+    ("Message", pa.string()),
+])
+RUNTIME_TIME_FORMAT = "%A, %d %B %Y %H:%M:%S"
+
+
+def dataset_path(report_path):
+    # "WAAS Reports/WAAS_Report_x.xlsx" -> "WAAS Reports/WAAS_Report_x.parquet"
+    return report_path.rsplit(".", 1)[0] + ".parquet"
+
+
+def table_rows(table):
+    # Row tuples of a batch with timestamps as sortable "YYYY-MM-DD HH:MM:SS" text
+    columns = []
+    for field in table.schema:
+        column = table.column(field.name)
+        if pa.types.is_timestamp(field.type):
+            column = pc.strftime(column, format="%Y-%m-%d %H:%M:%S")
+        columns.append(column.to_pylist())
+    return zip(*columns)
+
+
+class TimeRange:
+    # Earliest and latest values of the timestamp arrays passed to add()
+    def __init__(self):
+        self.first = None
+        self.last = None
+
+    def add(self, times):
+        bounds = pc.min_max(times).as_py()
+        if bounds["min"] is not None:
+            self.first = bounds["min"] if self.first is None else min(self.first, bounds["min"])
+            self.last = bounds["max"] if self.last is None else max(self.last, bounds["max"])
+
+
+class ParquetTableWriter:
+    # Buffers rows column by column and writes them as row groups. Timestamp
+    # columns are given as the report's display strings and parsed per batch,
+    # or, without a `time_format`, as datetimes already.
+    # `sink`, if given, is called with every batch as a pyarrow Table and the
+    # keys passed with its rows, and returns for every row whether to write it.
+    def __init__(self, path, schema, time_format, batch_rows=50000, sink=None):
+        self.path = path
+        self.schema = schema
+        self.time_format = time_format
+        self.batch_rows = batch_rows
+        self.sink = sink
+        self.columns = [[] for _ in schema]
+        self.keys = []
+        self.rows = 0
+        self.written = 0
+        string_columns = [field.name for field in schema if pa.types.is_string(field.type)]
+        self.writer = pq.ParquetWriter(path, schema, use_dictionary=string_columns, compression="snappy")
+
+    def write_row(self, values, key=None):
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        self.keys.append(key)
+        self.rows += 1
+        if len(self.columns[0]) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.columns[0]:
+            return
+        arrays = []
+        for field, values in zip(self.schema, self.columns):
+            if pa.types.is_timestamp(field.type) and self.time_format is not None:
+                arrays.append(pc.strptime(pa.array(values, pa.string()), format=self.time_format, unit="s", error_is_null=True))
+            else:
+                arrays.append(pa.array(values, field.type))
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+        if self.sink is not None:
+            table = table.filter(pa.array(self.sink(table, self.keys), pa.bool_()))
+        if table.num_rows:
+            self.writer.write_table(table)
+            self.written += table.num_rows
+        self.columns = [[] for _ in self.schema]
+        self.keys = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
@@ -0,0 +1,92 @@
+import os, time, threading, datetime, math
+from email.utils import parsedate_to_datetime
+
+
+# Lowest request rate the limiter is configured with, so it never stalls at zero
+MIN_RATE = 0.01
+
+
+def env_float(name, default):
+    try:
+        value = float(os.getenv(name, default))
+    except ValueError:
+        return float(default)
+    return value if math.isfinite(value) else float(default)
+
+
+class RateLimiter:
+    # Token bucket shared by every thread talking to the console. The refill rate
+    # backs off by half on a 429 and creeps back up on every successful call.
+    def __init__(self, rate, max_rate, min_rate=0.2):
+        self.max_rate = max(MIN_RATE, max_rate)
+        self.min_rate = min(max(MIN_RATE, min_rate), self.max_rate)
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.step = self.max_rate / 50
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    # Allow a burst of up to one second worth of requests
+                    self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.step)
+
+    def on_throttle(self, retry_after=None, sent=None):
+        # `sent` is when the throttled request was sent. Requests already in
+        # flight when the rate was last halved belong to the same burst, so
+        # their 429s only extend the pause instead of halving the rate again.
+        with self.lock:
+            now = time.monotonic()
+            if sent is None or sent >= self.throttled_at:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.throttled_at = now
+            self.tokens = 0.0
+            self.updated = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            return self.rate
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(env_float("RATE_LIMIT", "5"), env_float("RATE_LIMIT_MAX", "20"))
+        return _limiter
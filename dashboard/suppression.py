@@ -0,0 +1,128 @@
+import json, os, re
+
+# Rule conditions and the audit fields they look at. "message" is a
+# case-insensitive substring and "regex" a regular expression, both searched in
+# the message; the others are exact values. Each is a string or a list of them.
+RUNTIME_FIELDS = {
+    "message": "msg",
+    "regex": "msg",
+    "attack_type": "attackType",
+    "image": "imageName",
+    "namespace": "namespace",
+}
+
+DEFAULT_RUNTIME_RULES = {
+    "suppress": [
+        {"name": "low likelihood", "message": "Low likelihood that this event is suspicious"},
+    ],
+    "keep": [],
+}
+
+
+def load_rules(name, default, fields):
+    # Rules from a JSON environment variable, or from the JSON file it names, e.g.
+    # RUNTIME_RULES='{"suppress": [{"name": "dev", "namespace": ["dev", "test"]}], "keep": [{"attack_type": "cryptominers"}]}'
+    # Returns them compiled into a RuleSet; rules that do not parse or compile
+    # are reported and the default ones used instead.
+    value = os.getenv(name)
+    if not value:
+        return RuleSet(default, fields)
+    try:
+        if os.path.isfile(value):
+            with open(value) as f:
+                return RuleSet(json.load(f), fields)
+        return RuleSet(json.loads(value), fields)
+    except ValueError as e:
+        print("Ignoring invalid {}: {}".format(name, e))
+        return RuleSet(default, fields)
+
+
+class Matcher:
+    # All rules of one kind compiled once: every message condition becomes a
+    # named alternative of a single regex, every exact value a dict entry, so an
+    # event costs one search and a few lookups however many rules there are.
+    # Regex rules are compiled on their own, since they may carry inline flags
+    # such as "(?i)" that are only valid at the start of a pattern.
+    def __init__(self, rules, fields):
+        if not isinstance(rules, list):
+            raise ValueError("Expected a list of rules, got {}".format(json.dumps(rules)))
+        self.names = []
+        self.values = {}
+        self.regexes = []
+        patterns = []
+        for rule in rules:
+            if not isinstance(rule, dict):
+                raise ValueError("Rule {} is not a JSON object".format(json.dumps(rule)))
+            conditions = [key for key in rule if key in fields]
+            if len(conditions) != 1:
+                raise ValueError("Rule {} needs exactly one of {}".format(json.dumps(rule), ", ".join(fields)))
+            condition = conditions[0]
+            values = rule[condition] if isinstance(rule[condition], list) else [rule[condition]]
+            if not values or not all(isinstance(value, str) for value in values):
+                raise ValueError("Rule {} needs a string or a list of strings".format(json.dumps(rule)))
+            index = len(self.names)
+            self.names.append(rule.get("name") or "{}={}".format(condition, rule[condition]))
+            if condition == "message":
+                patterns.append("(?P<r{}>(?i:{}))".format(index, "|".join(re.escape(value) for value in values)))
+            elif condition == "regex":
+                for value in values:
+                    try:
+                        self.regexes.append((index, re.compile(value)))
+                    except re.error as e:
+                        raise ValueError("Rule {} has an invalid regex: {}".format(json.dumps(rule), e))
+            else:
+                lookup = self.values.setdefault(fields[condition], {})
+                for value in values:
+                    lookup.setdefault(value, index)
+        self.message_field = fields.get("message") or fields.get("regex")
+        self.pattern = re.compile("|".join(patterns)) if patterns else None
+
+    def match(self, event):
+        # Index of the first rule the event matches, or None
+        for field, lookup in self.values.items():
+            index = lookup.get(event.get(field))
+            if index is not None:
+                return index
+        message = event.get(self.message_field)
+        if not isinstance(message, str):
+            return None
+        index = None
+        if self.pattern is not None:
+            found = self.pattern.search(message)
+            if found:
+                index = int(found.lastgroup[1:])
+        for rule, regex in self.regexes:
+            if index is not None and rule > index:
+                break
+            if regex.search(message):
+                return rule
+        return index
+
+
+class RuleSet:
+    # Drops events matching a "suppress" rule unless a "keep" rule matches them
+    # too. Called with every event as it is fetched; counts the hits of each rule.
+    def __init__(self, rules, fields):
+        if not isinstance(rules, dict):
+            raise ValueError("Expected a JSON object with \"suppress\" and \"keep\" lists")
+        self.suppress = Matcher(rules.get("suppress", []), fields)
+        self.keep = Matcher(rules.get("keep", []), fields)
+        self.suppressed = [0] * len(self.suppress.names)
+        self.kept = [0] * len(self.keep.names)
+
+    def __call__(self, event):
+        index = self.suppress.match(event)
+        if index is None:
+            return True
+        kept = self.keep.match(event)
+        if kept is None:
+            self.suppressed[index] += 1
+            return False
+        self.kept[kept] += 1
+        return True
+
+    def report(self):
+        for name, hits in zip(self.suppress.names, self.suppressed):
+            print("Suppressed by '{}': {}".format(name, hits))
+        for name, hits in zip(self.keep.names, self.kept):
+            print("Kept by '{}': {}".format(name, hits))
@@ -0,0 +1,270 @@
+import argparse, datetime, json, random, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for the Prisma Cloud console, serving synthetic data for the
+# endpoints used by prisma_report_generator.py and add_runtime_rule.py.
+#   python mock_console.py --events 200000 --latency 50 --rate-429 0.05
+
+RUNTIME_AUDITS = "/api/v1/audits/runtime/container"
+WAAS_AUDITS = "/api/v33.01/audits/firewall/app/container"
+CONTAINER_PROFILES = "/api/v33.01/profiles/container"
+COLLECTIONS = "/api/v33.01/collections"
+RUNTIME_POLICY = "/api/v1/policies/runtime/container"
+
+BASE_TIME = datetime.datetime(2024, 1, 1)
+CLUSTERS = ["prod-cluster", "staging-cluster", "dev-cluster"]
+NAMESPACES = ["default", "payments", "frontend", "backend", "monitoring"]
+IMAGES = ["registry.example.com/shop/web:1.4.2", "registry.example.com/shop/api:2.0.1", "docker.io/library/nginx:1.25", "docker.io/library/redis:7.2"]
+RUNTIME_ATTACKS = ["suspiciousBinary", "cryptoMiner", "reverseShell", "unexpectedProcess", "unexpectedListeningPort"]
+WAAS_ATTACKS = ["xss", "sqli", "cmdi", "lfi", "attackTools", "shellshock"]
+EFFECTS = ["alert", "ban", "prevent", "allow"]
+MESSAGES = ["{} launched a suspicious binary", "{} connected to a known mining pool", "{} opened an unexpected port", "Low likelihood that this event is suspicious: {} ran a known process"]
+
+
+def format_time(dt):
+    return "{}.{:03d}Z".format(dt.strftime("%Y-%m-%dT%H:%M:%S"), dt.microsecond // 1000)
+
+
+def parse_time(value):
+    value = value.rstrip("Z")
+    base, _, fraction = value.partition(".")
+    dt = datetime.datetime.strptime(base, "%Y-%m-%dT%H:%M:%S")
+    return dt + datetime.timedelta(microseconds=int((fraction + "000000")[:6]))
+
+
+def runtime_event(i, interval):
+    rnd = random.Random(i)
+    container = "app-{}".format(i % 40)
+    return {
+        "_id": "runtime-{}".format(i),
+        "time": format_time(BASE_TIME + datetime.timedelta(seconds=i * interval)),
+        "containerName": container,
+        "cluster": CLUSTERS[i % len(CLUSTERS)],
+        "imageName": IMAGES[i % len(IMAGES)],
+        "hostname": "worker-{}".format(i % 12),
+        "port": rnd.choice([0, 80, 443, 8080]),
+        "processPath": rnd.choice(["/bin/sh", "/usr/bin/curl", "/tmp/xmrig", "/usr/sbin/nginx"]),
+        "command": rnd.choice(["sh -c id", "curl http://10.0.0.1", "./xmrig -o pool", "nginx -g daemon off;"]),
+        "namespace": NAMESPACES[i % len(NAMESPACES)],
+        "attackType": RUNTIME_ATTACKS[i % len(RUNTIME_ATTACKS)],
+        "msg": MESSAGES[i % len(MESSAGES)].format(container),
+        "collections": ["All"],
+    }
+
+
+def waas_event(i, interval):
+    rnd = random.Random(i)
+    host = "app{}.example.com".format(i % 25)
+    path = "/api/v1/{}".format(rnd.choice(["login", "orders", "search", "users", "cart"]))
+    return {
+        "_id": "waas-{}".format(i),
+        "time": format_time(BASE_TIME + datetime.timedelta(seconds=i * interval)),
+        "url": "https://{}{}".format(host, path),
+        "urlPath": path,
+        "method": rnd.choice(["GET", "POST", "PUT"]),
+        "ns": [NAMESPACES[i % len(NAMESPACES)]],
+        "cluster": CLUSTERS[i % len(CLUSTERS)],
+        "type": WAAS_ATTACKS[i % len(WAAS_ATTACKS)],
+        "subnet": "203.0.113.{}".format(rnd.randint(1, 254)),
+        "imageName": IMAGES[i % len(IMAGES)],
+        "effect": EFFECTS[i % len(EFFECTS)],
+        "collections": ["All"],
+    }
+
+
+def container_profile(i):
+    image = "registry.example.com/team-{}/service-{}:1.{}".format(i % 7, i, i % 10)
+    return {
+        "_id": "profile-{}".format(i),
+        "image": image,
+        "cluster": CLUSTERS[i % len(CLUSTERS)],
+        "namespace": NAMESPACES[i % len(NAMESPACES)],
+        "os": "Debian GNU/Linux 12 (bookworm)",
+        "entrypoint": "/docker-entrypoint.sh",
+        "state": "active",
+        "collections": ["All"],
+        "network": {
+            "static": {"listeningPorts": [{"portsData": {"ports": [{"port": 8080}]}}]},
+            "behavioral": {"outboundPorts": {"ports": [{"port": 443}, {"port": 5432}]}, "listeningPorts": []},
+        },
+        "processes": {"static": [{"path": "/usr/local/bin/service"}], "behavioral": [{"path": "/bin/sh"}]},
+        "filesystem": {"static": [{"path": "/app"}], "behavioral": [{"path": "/tmp"}]},
+    }
+
+
+class MockConsole:
+    def __init__(self, events=10000, models=200, latency=0.0, rate_429=0.0, retry_after=1.0, interval=60, host="127.0.0.1", port=0):
+        self.events = events
+        self.models = models
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.reset_stats()
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "throttled": 0, "rows": 0, "collections": 0, "rules": 0}
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def time_range(self, query):
+        # Events are evenly spaced, so from/to filters map straight to index ranges
+        first, last = 0, self.events
+        if "from" in query:
+            seconds = (parse_time(query["from"][0]) - BASE_TIME).total_seconds()
+            first = max(first, int(-(-seconds // self.interval)))
+        if "to" in query:
+            seconds = (parse_time(query["to"][0]) - BASE_TIME).total_seconds()
+            last = min(last, int(seconds // self.interval) + 1)
+        return first, max(first, last)
+
+    def audit_page(self, path, query):
+        offset = int(query.get("offset", ["0"])[0])
+        limit = int(query.get("limit", ["100"])[0])
+        make = runtime_event if path == RUNTIME_AUDITS else waas_event
+        first, last = self.time_range(query)
+        if path == RUNTIME_AUDITS:
+            filters = {"cluster": "cluster", "namespace": "namespace", "attackType": "attackType"}
+        else:
+            filters = {"cluster": "cluster", "ns": "ns", "type": "type"}
+        active = {field: set(query[param][0].split(",")) for param, field in filters.items() if param in query}
+
+        if not active:
+            events = [make(i, self.interval) for i in range(first + offset, min(first + offset + limit, last))]
+        else:
+            events = []
+            skipped = 0
+            for i in range(first, last):
+                event = make(i, self.interval)
+                values = {field: event[field] if isinstance(event[field], list) else [event[field]] for field in active}
+                if all(allowed.intersection(values[field]) for field, allowed in active.items()):
+                    if skipped < offset:
+                        skipped += 1
+                        continue
+                    events.append(event)
+                    if len(events) == limit:
+                        break
+        if "fields" in query:
+            fields = query["fields"][0].split(",")
+            events = [{field: event[field] for field in fields if field in event} for event in events]
+        return events
+
+    def handler_class(self):
+        console = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def throttled(self):
+                console.count("requests")
+                if console.latency:
+                    time.sleep(console.latency)
+                if console.rate_429 and random.random() < console.rate_429:
+                    console.count("throttled")
+                    self.send_json(429, {"err": "rate limit exceeded"}, {"Retry-After": str(console.retry_after)})
+                    return True
+                return False
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/mock/stats":
+                    with console.lock:
+                        return self.send_json(200, dict(console.stats))
+                if self.throttled():
+                    return
+                query = parse_qs(url.query)
+                if url.path in (RUNTIME_AUDITS, WAAS_AUDITS):
+                    events = console.audit_page(url.path, query)
+                elif url.path == CONTAINER_PROFILES:
+                    offset = int(query.get("offset", ["0"])[0])
+                    limit = int(query.get("limit", ["100"])[0])
+                    events = [container_profile(i) for i in range(offset, min(offset + limit, console.models))]
+                elif url.path in (RUNTIME_POLICY, "/api/v33.01/policies/runtime/container"):
+                    return self.send_json(200, {"rules": []})
+                else:
+                    return self.send_json(404, {"err": "not found"})
+                console.count("rows", len(events))
+                self.send_json(200, events)
+
+            def read_body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length)
+
+            def do_POST(self):
+                body = self.read_body()
+                if self.throttled():
+                    return
+                if urlparse(self.path).path != COLLECTIONS:
+                    return self.send_json(404, {"err": "not found"})
+                json.loads(body or b"{}")
+                console.count("collections")
+                self.send_json(200, {})
+
+            def do_PUT(self):
+                body = self.read_body()
+                if self.throttled():
+                    return
+                if urlparse(self.path).path != RUNTIME_POLICY:
+                    return self.send_json(404, {"err": "not found"})
+                rules = json.loads(body or b"{}").get("rules", [])
+                console.count("rules", len(rules))
+                self.send_json(200, {})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock Prisma Cloud console with synthetic audits")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--events", type=int, default=10000, help="runtime and WAAS audits served per endpoint")
+    parser.add_argument("--models", type=int, default=200, help="container profiles served")
+    parser.add_argument("--latency", type=float, default=0.0, help="delay added to every request, in milliseconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--interval", type=int, default=60, help="seconds between consecutive synthetic audits")
+    args = parser.parse_args()
+
+    console = MockConsole(args.events, args.models, args.latency / 1000, args.rate_429, args.retry_after, args.interval, args.host, args.port)
+    print("Mock console listening on {} (set CONSOLE_PATH to this URL)".format(console.url))
+    try:
+        console.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,24 @@
-import requests, os, json, xlsxwriter, datetime, time
+import os, json, datetime, hashlib, functools, array
 from dotenv import load_dotenv
 import sys
 import os
 from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 # Add the Dashboard folder to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'dashboard'))
 
-import db
+import db, fetcher, console, event_sink, parquet_store, excel_writer, timestamps, suppression, external_sort, aggregates
 load_dotenv()
 date_now = datetime.datetime.now()
+JAKARTA_TZ = ZoneInfo("Asia/Bangkok")
+# Events converted to report times in one go
+TIME_BATCH = 10000
 
 class WAAS:
-    def __init__(self, host, time, namespace, url, attack_type, endpoint, src_ip, path, image, effect):
+    # One report row per firewall event; slotted, since a report holds every event at once
+    __slots__ = ("host", "time", "namespace", "url", "attack_type", "endpoint", "src_ip", "path", "image", "effect", "local_time", "event_id", "seq")
+
+    def __init__(self, host, time, namespace, url, attack_type, endpoint, src_ip, path, image, effect, local_time=None, event_id=None, seq=None):
         self.host = host
         self.time = time
         self.namespace = namespace
@@ -22,21 +29,34 @@ class WAAS:
         self.path = path
         self.image = image
         self.effect = effect
+        self.local_time = local_time
+        self.event_id = event_id
+        # Position of the event in its dataset
+        self.seq = seq
     
     def __str__(self):
         return f"Time: {self.time}\nURL: {self.url}\nAttack Type: {self.attack_type}\nEndpoint: {self.endpoint}\nIP: {self.src_ip}\nPath: {self.path}\nImage: {self.image}\n\n"
 
     
     def parse_time(self):
-        try:
-            utc_dt = datetime.datetime.strptime(self.time, "%Y-%m-%dT%H:%M:%SZ")
-        except ValueError:
-            utc_dt = datetime.datetime.strptime(self.time, "%Y-%m-%dT%H:%M:%S.%fZ")
+        return format_waas_time(self.time)
+
+    def values(self):
+        # Cells of the report row, in the order of the WAAS columns
+        return (self.host, self.url, self.local_time, self.namespace, self.attack_type, self.endpoint, self.src_ip, self.path, self.image, self.effect)
+
+def format_waas_time(time):
+    try:
+        utc_dt = datetime.datetime.strptime(time, "%Y-%m-%dT%H:%M:%SZ")
+    except ValueError:
+        utc_dt = datetime.datetime.strptime(time, "%Y-%m-%dT%H:%M:%S.%fZ")
 
-        gmt7_dt = utc_dt + datetime.timedelta(hours=7)
-        return gmt7_dt.strftime("%d-%m-%Y %H:%M:%S")
+    gmt7_dt = utc_dt + datetime.timedelta(hours=7)
+    return gmt7_dt.strftime("%d-%m-%Y %H:%M:%S")
     
 class ContainerModel:
+    __slots__ = ("image", "cluster", "namespace", "os", "entrypoint", "state", "collections")
+
     def __init__(self, image, cluster, namespace, os, entrypoint, state, collections):
         self.image = image
         self.cluster = cluster
@@ -50,6 +70,8 @@ class ContainerModel:
         return f"Image: {self.image}\nCluster: {self.cluster}\nNamespace: {self.namespace}\nOS: {self.os}\nEntrypoint: {self.entrypoint}\nState: {self.state}\nCollection: {self.collections}"
 
 class Runtime:
+    __slots__ = ("cluster", "container", "hostname", "namespace", "image", "message", "attack_type", "attack_technique", "cmd")
+
     def __init__(self, cluster, container, namespace, hostname, image, message, attack_type, attack_technique, cmd):
         self.cluster = cluster
         self.container = container
@@ -78,184 +100,301 @@ class Runtime:
 #         print(response.url)
 #         return None
     
-def generate_runtime_report():
-    url = "{}/api/v1/audits/runtime/container".format(os.getenv("CONSOLE_PATH"))
-    headers = {
-    'Accept': 'application/json',
-    'Authorization': 'Basic {}'.format(os.getenv("TOKEN"))
-    }
-    offset = 0
-    page_size = 100
-    max_attempts = 5
-    all_runtimes = []
-    while True:
-        params = {
-            "limit": page_size,
-            "offset": offset,
-        }
-        response = requests.request("GET", url, headers=headers, params=params)
-        print("Response Code: {}".format(response.status_code))
-        if response.status_code == 200:
-            events = response.json()
-            if not events:
-                print("\nAll events have been fetched!\n")
-                print("Events: ", events)
-                break
-            
-            all_runtimes.extend(events)
-            offset += page_size
-            print("Retrieved {} data from {}".format(len(all_runtimes), response.url))
-        elif response.status_code == 429:
-            # Retry after a delay if we hit the rate limit
-            for attempt in range(1, max_attempts + 1):
-                print(f"Rate limited. Retrying in {attempt * 2} seconds...")
-                time.sleep(attempt * 2)  # Exponential backoff
-                response = requests.request("GET", url, headers=headers, params=params)
-                if response.status_code == 200:
-                    break
-            return response.status_code
-        else:
-            print(response.url)
-            print(response.text)
-            print("Max retry attempts reached. Exiting.")
-            return response.status_code
-    
-    print("Writing to 'result_data_runtimes.json'")
-    with open("result_data_runtimes.json", "w") as f:
-        f.write(json.dumps(all_runtimes, indent=4))
-    f.close()
-    
+def event_time_key(event):
+    # Sortable key for "2024-01-01T00:00:00[.fraction]Z" without parsing every timestamp
+    base, _, fraction = event.get("time", "").rstrip("Z").partition(".")
+    return (base, fraction.ljust(9, "0"))
+
+def parse_event_time(value):
+    base = value.rstrip("Z").partition(".")[0]
+    return datetime.datetime.strptime(base, "%Y-%m-%dT%H:%M:%S")
+
+def resume_checkpoint(key, dataset, full):
+    # An unfinished run for the same dataset is picked up from its last committed
+    # page; a full refresh only resumes a full run, never an incremental one.
+    checkpoint = db.get_checkpoint(key)
+    if checkpoint is None:
+        return None
+    target = checkpoint["target"]
+    if checkpoint["dataset"] != dataset or (full and target == dataset) or not os.path.exists(target) or os.path.getsize(target) < checkpoint["sink_bytes"]:
+        db.clear_checkpoint(key)
+        return None
+    # Drop anything written after the last committed page
+    with open(target, "r+b") as f:
+        f.truncate(checkpoint["sink_bytes"])
+    print("Resuming {} from {} {}".format(key, "window" if "window_hours" in checkpoint["params"] else "offset", checkpoint["next_offset"]))
+    return checkpoint
+
+def fetch_dataset(client, path, dataset, full=False, incremental=True, windowed=None, filters=None, fields=None, keep=None):
+    # Only ask the console for events newer than the stored high-water mark and
+    # append them to the dataset from the previous run. Pages are streamed
+    # straight to the NDJSON dataset, never held in memory as a whole, and every
+    # committed page is checkpointed so a failed run can be resumed.
+    # In windowed mode the period is split into time windows fetched in
+    # parallel, and the checkpoint position is a window index and the offset
+    # inside it. A full windowed run only reaches
+    # FETCH_WINDOW_DAYS back, so older events are carried over from the
+    # previous dataset.
+    # `filters` and `fields` are sent to the console as query parameters; `keep`
+    # drops events client-side before they are stored.
+    if windowed is None:
+        windowed = fetcher.windowed_mode()
+    key = path + fetcher.filter_suffix(filters)
+    checkpoint = resume_checkpoint(key, dataset, full)
+    newest = None
+    start = 0
+    window_offset = 0
+    if checkpoint is not None:
+        target = checkpoint["target"]
+        params = json.loads(checkpoint["params"])
+        start = checkpoint["next_offset"]
+        window_offset = checkpoint.get("window_offset") or 0
+        if checkpoint["newest_time"]:
+            newest = {"time": checkpoint["newest_time"], "_id": checkpoint["newest_id"]}
+    else:
+        mark = None if full or not incremental or not os.path.exists(dataset) else db.get_mark(key)
+        params = fetcher.filter_params(path, filters, fields)
+        if mark is not None and ("from" not in params or event_time_key({"time": mark[0]}) > event_time_key({"time": params["from"]})):
+            params["from"] = mark[0]
+        # A full run writes to a temporary file so a failed run keeps the previous dataset
+        target = dataset if mark is not None else dataset + ".tmp"
+        if windowed:
+            until = parse_event_time(params["to"]) if "to" in params else datetime.datetime.utcnow().replace(microsecond=0)
+            since = parse_event_time(params["from"]) if "from" in params else until - datetime.timedelta(days=fetcher.get_window_days())
+            params.update({"from": fetcher.format_time(since), "to": fetcher.format_time(until), "window_hours": fetcher.get_window_hours()})
+
+    windows = None
+    since = params.get("from")
+    if "window_hours" in params:
+        windows = fetcher.time_windows(parse_event_time(params["from"]), parse_event_time(params["to"]), params["window_hours"])
+        if start < len(windows):
+            since = windows[start][0]
+
+    mode = "ab" if target == dataset or checkpoint is not None else "wb"
+    known_ids = set()
+    if since is not None and mode == "ab":
+        # The "from" filter is inclusive, so events at the mark itself come back again
+        since_key = event_time_key({"time": since})
+        known_ids = set(event["_id"] for event in event_sink.read_events(target) if event.get("_id") and event_time_key(event) >= since_key)
+    if since is not None:
+        print("Fetching events newer than {} from {}".format(since, client.url(path)))
+
+    if windows is not None:
+        query = {key: value for key, value in params.items() if key not in ("from", "to", "window_hours")}
+        pages = fetcher.fetch_windows(client, path, windows, params=query, start_index=start, start_offset=window_offset)
+    else:
+        pages = ((None, offset, events) for offset, events in fetcher.fetch_pages(client, path, params=params, start_offset=start))
+
+    dropped = 0
+    with event_sink.EventSink(target, mode, compress=dataset.endswith(".gz")) as sink:
+        if windows is not None and mode == "wb" and os.path.exists(dataset):
+            # Re-filtered like newly fetched events, so changed rules apply to them too
+            since_key = event_time_key({"time": params["from"]})
+            older = (event for event in event_sink.read_events(dataset) if event_time_key(event) < since_key)
+            for events in timestamps.batches(older, fetcher.PAGE_SIZE):
+                stored = [event for event in events if keep is None or keep(event)]
+                dropped += len(events) - len(stored)
+                if stored:
+                    sink.write_page(stored)
+            print("Kept {} events older than {} from '{}'".format(sink.count, params["from"], dataset))
+        for index, offset, events in pages:
+            events = [event for event in events if not event.get("_id") or event["_id"] not in known_ids]
+            if windows is not None:
+                # Events on a window boundary can be returned by both windows
+                known_ids.update(event["_id"] for event in events if event.get("_id"))
+            if events:
+                page_newest = max(events, key=event_time_key)
+                if newest is None or event_time_key(page_newest) > event_time_key(newest):
+                    newest = page_newest
+            stored = [event for event in events if keep is None or keep(event)]
+            dropped += len(events) - len(stored)
+            if fields:
+                stored = [fetcher.project(event, fields) for event in stored]
+            if stored:
+                sink.write_page(stored)
+            db.save_checkpoint(key, dataset, target, json.dumps(params), offset + fetcher.PAGE_SIZE if index is None else index, sink.tell(),
+                               newest.get("time") if newest else None, newest.get("_id") if newest else None,
+                               datetime.datetime.now().isoformat(), None if index is None else offset + fetcher.PAGE_SIZE)
+            if windows is not None:
+                print("Retrieved {} data from {} (window {}/{}, offset {})".format(sink.count, client.url(path), index + 1, len(windows), offset))
+            else:
+                print("Retrieved {} data from {} (offset {})".format(sink.count, client.url(path), offset))
+    if target != dataset:
+        # The dataset is rebuilt from scratch, so its events are stored afresh
+        db.start_generation(event_sink.source_name(dataset))
+        os.replace(target, dataset)
+    print("{} new events written to '{}', {} filtered out".format(sink.count, dataset, dropped))
+
+    with db.batch():
+        if incremental and newest is not None and newest.get("time"):
+            db.set_mark(key, newest["time"], newest.get("_id"))
+        db.clear_checkpoint(key)
+    return dataset
+
+# Fields of each audit used by the reports, requested from the console with "fields"
+RUNTIME_FIELDS = ["_id", "containerName", "cluster", "imageName", "hostname", "time", "port", "processPath", "command", "namespace", "attackType", "msg"]
+WAAS_FIELDS = ["_id", "url", "ns", "time", "type", "method", "urlPath", "subnet", "imageName", "effect"]
+
+def fetch_runtime_dataset(full=False, filters=None, rules=None):
+    client = console.get_client()
+    path = "/api/v1/audits/runtime/container"
+    if filters is None:
+        filters = fetcher.load_filters("RUNTIME_FILTERS")
+    if rules is None:
+        keep = suppression.load_rules("RUNTIME_RULES", suppression.DEFAULT_RUNTIME_RULES, suppression.RUNTIME_FIELDS)
+    else:
+        keep = suppression.RuleSet(rules, suppression.RUNTIME_FIELDS)
+    dataset = fetch_dataset(client, path, event_sink.dataset_path("result_data_runtimes" + fetcher.filter_suffix(filters)), full,
+                            filters=filters, fields=RUNTIME_FIELDS, keep=keep)
+    keep.report()
+    return dataset
+
+def build_runtime_report(dataset):
     columns = ["containerName", "Cluster", "imageName", "Hostname", "Time", "Port", "Path", "Command", "Namespace", "AttackType", "Message" ]
     filename = "Runtime_Report_{}.xlsx".format(date_now.strftime("%Y_%m_%d_%H-%M-%S"))
-    write_runtime_to_excel(filename, columns, all_runtimes)
-def generate_container_model_report():
-    max_attempts = 5  # Number of retry attempts in case of rate limiting
-    page_size = 100
-    offset = 0
-    url = "{}/api/v33.01/profiles/container".format(os.getenv("CONSOLE_PATH"))
-    headers = {
-    'Accept': 'application/json',
-    'Authorization': 'Basic {}'.format(os.getenv("TOKEN"))
-    }
-    all_models = []
-    while True:
-        params = {
-            "limit": page_size,
-            "offset": offset
-        }
-
-        response = requests.request("GET", url, headers=headers, params=params)
-        print("Response Code: {}".format(response.status_code))
-        if response.status_code == 200:
-            events = response.json()
-            if not events:
-                print("\nAll events have been fetched!\n")
-                break
-
-            all_models.extend(events)
-            offset += page_size
-            print("Retrieved {} data from {}".format(len(all_models), response.url))
-        elif response.status_code == 429:
-            # Retry after a delay if we hit the rate limit
-            for attempt in range(1, max_attempts + 1):
-                print(f"Rate limited. Retrying in {attempt * 2} seconds...")
-                time.sleep(attempt * 2)  # Exponential backoff
-                response = requests.request("GET", url, headers=headers, params=params)
-                if response.status_code == 200:
-                    break
-        else:
-            print("Max retry attempts reached. Exiting.")
-            break
-    with open("result_data_container_json.json", "w") as f:
-        f.write(json.dumps(all_models, indent=4))
-    f.close()
-    
-    models = []
-    for model in all_models:
-        new_model = ContainerModel(model["image"], model["cluster"], model["namespace"], model["os"], model["entrypoint"], model["state"], model["collections"])
-        models.append(new_model)
-    
+    write_runtime_to_excel(filename, columns, event_sink.read_events(dataset), event_sink.source_name(dataset))
+
+def generate_runtime_report(full=False, filters=None):
+    try:
+        dataset = fetch_runtime_dataset(full, filters)
+    except fetcher.FetchError as e:
+        print("Max retry attempts reached. Exiting.")
+        return e.status_code
+    build_runtime_report(dataset)
+
+def fetch_container_model_dataset(full=False):
+    # Container profiles have no event time, so every run is a full fetch
+    client = console.get_client()
+    path = "/api/v33.01/profiles/container"
+    return fetch_dataset(client, path, event_sink.dataset_path("result_data_container_json"), incremental=False, windowed=False)
+
+def build_container_model_report(dataset):
     columns = ["Image", "Cluster", "Namespace", "OS", "Entrypoint", "State", "Collections"]
     filename = "Container_Model_Report_{}.xlsx".format(date_now.strftime("%Y_%m_%d_%H-%M-%S"))
-    return all_models
-    write_container_model_to_excel(filename=filename, cols=columns, data=all_models)
+    write_container_model_to_excel(filename=filename, cols=columns, data=event_sink.read_events(dataset))
 
+def generate_container_model_report():
+    try:
+        dataset = fetch_container_model_dataset()
+    except fetcher.FetchError as e:
+        print("Max retry attempts reached. Exiting.")
+        return e.status_code
+    build_container_model_report(dataset)
+    return dataset
+
+@functools.lru_cache(maxsize=65536)
 def get_host(url):
-    return url.split("//")[1].split("/")[0]
-
-def generate_waas_report():
-    max_attempts = 5  # Number of retry attempts in case of rate limiting
-    page_size = 100
-    offset = 0
-    url = "{}/api/v33.01/audits/firewall/app/container".format(os.getenv("CONSOLE_PATH"))
-    headers = {
-    'Accept': 'application/json',
-    'Authorization': 'Basic {}'.format(os.getenv("TOKEN"))
-    }
-    all_events = []
-    while True:
-        params = {
-            "limit": page_size,
-            "offset": offset
-        }
-
-        response = requests.request("GET", url, headers=headers, params=params)
-        print("Response Code: {}".format(response.status_code))
-        if response.status_code == 200:
-            events = response.json()
-            if not events:
-                print("\nAll events have been fetched!\n")
-                print("Events: ", events)
-                break
-
-            all_events.extend(events)
-            offset += page_size
-            print("Retrieved {} data from {}".format(len(all_events), response.url))
-        elif response.status_code == 429:
-            # Retry after a delay if we hit the rate limit
-            for attempt in range(1, max_attempts + 1):
-                print(f"Rate limited. Retrying in {attempt * 2} seconds...")
-                time.sleep(attempt * 2)  # Exponential backoff
-                response = requests.request("GET", url, headers=headers, params=params)
-                if response.status_code == 200:
-                    break
-            return response.status_code
-        else:
-            print("Max retry attempts reached. Exiting.")
-            return response.status_code
-        
-    with open("result_data_waas.json", "w") as f:
-        f.write(json.dumps(all_events, indent=4))
-    f.close()
-
-    reports = {}
-    for report in all_events:
-        host = get_host(report["url"])
-        namespace = report["ns"][0]
-        newReport = WAAS(host, report["time"], namespace, report["url"], report["type"], '{} {}'.format(report["method"],report["urlPath"]), report["subnet"], report["urlPath"], report["imageName"], report["effect"])
-        if newReport.url not in reports:
-            reports[newReport.url] = []
-        reports[newReport.url].append({
-            "host": newReport.host,
-            "time": newReport.parse_time(),
-            "namespace": namespace,
-            "attack_type": newReport.attack_type,
-            "endpoint": newReport.endpoint,
-            "src_ip": newReport.src_ip,
-            "path": newReport.path,
-            "image": newReport.image,
-            "effect": newReport.effect
-        })
-       
-    with open('end_data.json', 'w') as f:
-        f.write(json.dumps(reports, indent=4))
-     
+    # Parsed once per distinct URL; hosts are interned so every row of a host shares one string
+    return sys.intern(url.split("//")[1].split("/")[0])
+
+def fetch_waas_dataset(full=False, filters=None):
+    client = console.get_client()
+    path = "/api/v33.01/audits/firewall/app/container"
+    if filters is None:
+        filters = fetcher.load_filters("WAAS_FILTERS")
+    return fetch_dataset(client, path, event_sink.dataset_path("result_data_waas" + fetcher.filter_suffix(filters)), full,
+                         filters=filters, fields=WAAS_FIELDS)
+
+def read_waas_rows(dataset, time_range):
+    seq = 0
+    for events in timestamps.batches(event_sink.read_events(dataset), TIME_BATCH):
+        times, typed_times = timestamps.to_gmt7([report["time"] for report in events], parquet_store.WAAS_TIME_FORMAT, format_waas_time)
+        time_range.add(typed_times)
+        for report, report_time in zip(events, times):
+            url = sys.intern(report["url"])
+            namespace = report["ns"][0]
+            yield WAAS(get_host(url), report["time"], namespace, url, report["type"], '{} {}'.format(report["method"],report["urlPath"]), report["subnet"], report["urlPath"], report["imageName"], report["effect"],
+                       report_time, event_sink.event_key(report), seq)
+            seq += 1
+
+def summarize_urls(rows, summary):
+    # Passes the rows through while counting per URL: host, number of events and events per attack type
+    for row in rows:
+        entry = summary.get(row.url)
+        if entry is None:
+            entry = summary[row.url] = {"host": row.host, "events": 0, "attack_types": {}}
+        entry["events"] += 1
+        entry["attack_types"][row.attack_type] = entry["attack_types"].get(row.attack_type, 0) + 1
+        yield row
+
+def group_in_memory(rows):
+    # Rows are kept in fetch order; each URL group holds the indices of its rows
+    kept = []
+    groups = {}
+    for row in rows:
+        group = groups.get(row.url)
+        if group is None:
+            group = groups[row.url] = array.array("L")
+        group.append(len(kept))
+        kept.append(row)
+    for group in groups.values():
+        for index in group:
+            yield kept[index]
+
+def group_external(rows):
+    # Same order as group_in_memory (URLs by first appearance, then fetch order),
+    # sorted in bounded runs spilled to disk instead of held in memory
+    ranks = {}
+    records = ((ranks.setdefault(row.url, len(ranks)), seq) + tuple(getattr(row, name) for name in WAAS.__slots__) for seq, row in enumerate(rows))
+    for record in external_sort.external_sort(records):
+        yield WAAS(*record[2:])
+
+def build_waas_report(dataset):
+    summary = {}
+    time_range = parquet_store.TimeRange()
+    rows = summarize_urls(read_waas_rows(dataset, time_range), summary)
+    if os.getenv("WAAS_GROUPING", "memory").lower() == "external":
+        rows = group_external(rows)
+    else:
+        rows = group_in_memory(rows)
+
     columns = ["Host", "URL", "Time", "Namespace", "AttackType", "APIEndpoint", "IPAddress", "Path", "Image", "Effect"]
     filename = "WAAS_Report_{}.xlsx".format(date_now.strftime("%Y_%m_%d_%H-%M-%S"))
-    write_waas_to_excel(filename, columns, reports)
+    write_waas_to_excel(filename, columns, rows, summary, event_sink.source_name(dataset), time_range)
 
+    with open('end_data.json', 'w') as f:
+        json.dump(summary, f, separators=(",", ":"))
 
-    
+def generate_waas_report(full=False, filters=None):
+    try:
+        dataset = fetch_waas_dataset(full, filters)
+    except fetcher.FetchError as e:
+        print("Max retry attempts reached. Exiting.")
+        return e.status_code
+    build_waas_report(dataset)
+
+def generate_all_reports(full=False):
+    # Fetch all three datasets at once; they share the console client and its
+    # rate limiter, so together they never exceed the console's budget.
+    fetches = {
+        "WAAS": (fetch_waas_dataset, build_waas_report),
+        "Runtime": (fetch_runtime_dataset, build_runtime_report),
+        "Container Models": (fetch_container_model_dataset, build_container_model_report),
+    }
+    datasets = {}
+    failed = {}
+    with ThreadPoolExecutor(max_workers=len(fetches)) as pool:
+        futures = {name: pool.submit(fetch, full) for name, (fetch, _) in fetches.items()}
+        for name, future in futures.items():
+            try:
+                datasets[name] = future.result()
+                print("{} data fetched".format(name))
+            except fetcher.FetchError as e:
+                print("Failed to fetch {} data: {}".format(name, e.status_code))
+                failed[name] = e.status_code
+
+    # Writing the workbooks is CPU bound, so each report gets its own process
+    with ProcessPoolExecutor(max_workers=max(1, len(datasets))) as pool:
+        futures = {name: pool.submit(fetches[name][1], dataset) for name, dataset in datasets.items()}
+        for done, (name, future) in enumerate(futures.items(), start=1):
+            try:
+                future.result()
+            except Exception as e:
+                print("Failed to generate {} report: {}".format(name, e))
+                failed[name] = str(e)
+                continue
+            print("{} Report Generated ({}/{})".format(name, done, len(futures)))
+    return failed or None
 
 def main():
     print("====== PRISMA CLOUD CWP REPORT GENERATOR ======")
@@ -272,216 +411,144 @@ def main():
     elif opt == 3:
         generate_container_model_report()
     elif opt == 4:
-        print("Generating all report (0/2)")
-        print("Generating WAAS Report...")
-        generate_waas_report()
-        print("WAAS Report Generated")
-        print("Generating all report (1/2)")
-        print("Generating Container Models Report...")
-        generate_container_model_report()
-        print("Container Models Generated")
-        print("Generating all report (2/2)")
-        print("All reports generated! Exiting..")
+        print("Generating WAAS, Runtime and Container Models Reports...")
+        failed = generate_all_reports()
+        if failed:
+            print("Some reports could not be generated: {}".format(failed))
+        else:
+            print("All reports generated! Exiting..")
     
 def write_container_model_to_excel(filename, cols, data):
     directory = "Container Model Reports"
     os.makedirs(directory, exist_ok=True)
     filepath = os.path.join(directory, filename)
-    workbook = xlsxwriter.Workbook(filepath, {'strings_to_urls': False})
-    worksheet = workbook.add_worksheet("{}".format(date_now.strftime("%Y-%m-%d")))
-    
-    # WRITE HEADERS #
-    headers = ["image", "cluster", "namespace", "os", "entrypoint", "state", "collections"]
-    header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#0070C0',
-        'border': 1,
-        'font_color': '#ffffff'
-    })
-    
-    worksheet.write_row("A1", cols, header_format)
-    # WRITE ROW DATA #
-
-    cell_format = workbook.add_format({
-        'border': 1,
-        'align': 'left',
-        'valign': 'top'
-    })
-    row = 1
-    max_lengths = [len(header) for header in headers]
-    for model in data:
-        worksheet.write_row(row, 0, [model["image"], model["cluster"], model["namespace"], model["os"], model["entrypoint"], model["state"], ", ".join(c for c in model["collections"])], cell_format=cell_format)
-        max_lengths[0] = max(max_lengths[0], len(model.get("image", "")))
-        max_lengths[1] = max(max_lengths[1], len(model.get("cluster", "")))
-        max_lengths[2] = max(max_lengths[2], len(model.get("namespace", "")))
-        max_lengths[3] = max(max_lengths[3], len(model.get("os", "")))
-        max_lengths[5] = max(max_lengths[5], len(model.get("state", "")))
-        max_lengths[6] = max(max_lengths[6], len(",".join(c for c in model.get("collections", ""))))
-        row += 1
-    
-    # WRITE ADJUST CELL WIDTH #
-
-    for col_num, length in enumerate(max_lengths):
-        worksheet.set_column(col_num, col_num, length + 2)  # Add 2 for padding
-
-    workbook.close()
+    rows = ([model["image"], model["cluster"], model["namespace"], model["os"], model["entrypoint"], model["state"], ", ".join(c for c in model["collections"])] for model in data)
+    with excel_writer.TableWriter(filepath, "{}".format(date_now.strftime("%Y-%m-%d")), cols) as table:
+        table.write_rows(rows)
     print("Report saved: {}".format(filepath))
     
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def report_metadata(filepath, table, times):
+    # Catalogue fields recorded with every report file; `times` is the TimeRange of all its rows
+    time_range = [value.strftime("%Y-%m-%d %H:%M:%S") if value is not None else None for value in (times.first, times.last)]
+    return {"rows": table.rows, "size": os.path.getsize(filepath), "first_time": time_range[0], "last_time": time_range[1],
+            "sha256": file_sha256(filepath), "sheets": json.dumps(table.sheets)}
+
+def event_table_sink(table, source, report):
+    # Stores each batch of new report rows in the indexed events table; only
+    # the events the store did not have yet go into this run's parquet part
+    def store(batch, keys):
+        return db.insert_events(table, source, report, keys, parquet_store.table_rows(batch))
+    return store
+    
 def convert_timezone_to_jakarta(time):
     try:
         utc_dt = datetime.datetime.strptime(time, "%Y-%m-%dT%H:%M:%S.%fZ")
         utc_dt = utc_dt.replace(tzinfo=datetime.timezone.utc)
-        gmt7_dt = utc_dt.astimezone(ZoneInfo("Asia/Bangkok"))
+        gmt7_dt = utc_dt.astimezone(JAKARTA_TZ)
         formatted_time = gmt7_dt.strftime("%A, %d %B %Y %H:%M:%S")
         return formatted_time
     except Exception as e:
         print(e)
         return "Error: Invalid time format"
     
-def write_waas_to_excel(filename, cols, data):
+def write_waas_to_excel(filename, cols, rows, urls, name, time_range):
+    # `rows` come grouped by URL; `urls` holds one entry per distinct URL.
+    # `name` is the source dataset; only its events past the ones already
+    # stored are passed on to the event store.
     directory = "WAAS Reports"
     os.makedirs(directory, exist_ok=True)
     filepath = os.path.join(directory, filename)
-    workbook = xlsxwriter.Workbook(filepath, {'strings_to_urls': False})
-    worksheet = workbook.add_worksheet("{}".format(date_now.strftime("%Y-%m-%d")))
-
-    # WRITE HEADERS #
-    headers = ["host", "url", "time", "namespace", "attack_type", "endpoint", "src_ip", "path", "image", "effect"]
-
-    header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#0070C0',
-        'border': 1,
-        'font_color': '#ffffff'
-    })
-
-    worksheet.write_row("A1", cols, header_format)
-
-    # WRITE ROW DATA #
-
-    cell_format = workbook.add_format({
-        'border': 1,
-        'align': 'left',
-        'valign': 'top'
-    })
-    row = 1
-    prev_url = None
-    merge_start_row = row
-    max_lengths = [len(header) for header in headers]
-    for url, items in data.items():
-        for item in items:
-            if url != prev_url:
-                # if prev_url is not None:
-                #     worksheet.merge_range(merge_start_row, 0, row - 1, 0, prev_url, cell_format=cell_format)
-                
-                prev_url = url
-                merge_start_row = row
-            worksheet.write_row(row, 0, [
-            item.get("host", ""),
-            url,
-            item.get("time", ""),
-            item.get("namespace", ""),
-            item.get("attack_type", ""),
-            item.get("endpoint", ""),
-            item.get("src_ip", ""),
-            item.get("path", ""),
-            item.get("image", ""),
-            item.get("effect", "")
-            ], cell_format=cell_format)
-            max_lengths[0] = max(max_lengths[0], len(url))  # URL column
-            max_lengths[1] = max(max_lengths[1], len(item.get("time", "")))
-            max_lengths[2] = max(max_lengths[2], len(item.get("attack_type", "")))
-            max_lengths[3] = max(max_lengths[3], len(item.get("endpoint", "")))
-            max_lengths[4] = max(max_lengths[4], len(item.get("src_ip", "")))
-            max_lengths[5] = max(max_lengths[5], len(item.get("path", "")))
-            max_lengths[6] = max(max_lengths[6], len(item.get("image", "")))
-            max_lengths[7] = max(max_lengths[7], len(item.get("effect", "")))
-            row += 1
-
-    # WRITE ADJUST CELL WIDTH #
-
-    for col_num, length in enumerate(max_lengths):
-        worksheet.set_column(col_num, col_num, length + 2)  # Add 2 for padding
-
-    workbook.close()
+    generation, stored = db.get_generation(name)
+    source = db.generation_source(name, generation)
+    table = excel_writer.TableWriter(filepath, "{}".format(date_now.strftime("%Y-%m-%d")), cols)
+    parquet_path = parquet_store.dataset_path(filepath)
+    parquet = parquet_store.ParquetTableWriter(parquet_path, parquet_store.WAAS_SCHEMA, parquet_store.WAAS_TIME_FORMAT,
+                                                 sink=event_table_sink("waas_events", source, filepath))
+    for item in rows:
+        values = item.values()
+        table.write_row(values)
+        if item.seq >= stored:
+            parquet.write_row(values, item.event_id)
+
+    table.close()
+    parquet.close()
     gmt_7 = datetime.timezone(datetime.timedelta(hours=7))
     curr_time = datetime.datetime.now(gmt_7)
-    table = "waas_files"
-    db.insert_file(filepath, table, curr_time)
+    with db.batch():
+        last_event = db.add_part("waas_events", source, parquet_path, filepath, parquet.written)
+        db.insert_file(filepath, "waas_files", curr_time, dataset=parquet_path, source=source, last_event=last_event, **report_metadata(filepath, table, time_range))
+        db.set_stored(name, generation, table.rows)
+    parts = [part for part in db.get_parts(filepath, "waas_files") if os.path.exists(part)]
+    try:
+        aggregates.write_sidecar(filepath, parts, "waas")
+    except Exception as e:
+        # The dashboard computes the charts itself when the sidecar is missing
+        print("Could not write chart aggregates: {}".format(e))
     print("Report saved: {}".format(filepath))
-    print("Total Unique URL: ", len(data))
+    print("Total Unique URL: ", len(urls))
+    print("New events stored: ", parquet.written)
     print()
 
-def write_runtime_to_excel(filename, cols, data):
+def write_runtime_to_excel(filename, cols, data, name):
     directory = "Runtime Reports"
     os.makedirs(directory, exist_ok=True)
     filepath = os.path.join(directory, filename)
-    workbook = xlsxwriter.Workbook(filepath, {'strings_to_urls': False})
-    worksheet = workbook.add_worksheet("{}".format(date_now.strftime("%Y-%m-%d")))
-    headers = ["containerName", "cluster", "imageName", "hostname", "time", "port", "processPath", "command", "namespace", "attackType", "msg"]
-
-    
-    header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#0070C0',
-        'border': 1,
-        'font_color': '#ffffff'
-    })
-
-    # WRITE HEADERS #
-    worksheet.write_row("A1", cols, header_format)
-
-    # WRITE ROW DATA #
-    max_lengths = [len(header) for header in headers]
-
-    cell_format = workbook.add_format({
-        'border': 1,
-        'align': 'left',
-        'valign': 'top'
-    })
-    row = 1
-    for _, row_data in enumerate(data, start=1):
-        if "Low likelihood that this event is suspicious".lower() in row_data.get("msg", "").lower():
-            continue
-        formatted_time = convert_timezone_to_jakarta(row_data.get('time', ''))
-        worksheet.write_row(row, 0, [
-            row_data.get("containerName", ""),
-            row_data.get("cluster", ""),
-            row_data.get("imageName", ""),
-            row_data.get("hostname", ""),
-            formatted_time,
-            row_data.get("port", ""),
-            row_data.get("processPath", ""),
-            row_data.get("command", ""),
-            row_data.get("namespace", ""),
-            row_data.get("attackType", ""),
-            row_data.get("msg", "")
-        ], cell_format=cell_format)
-        max_lengths[0] = max(max_lengths[0], len(row_data.get("containerName", "")))
-        max_lengths[1] = max(max_lengths[1], len(row_data.get("cluster", "")))
-        max_lengths[2] = max(max_lengths[2], len(row_data.get("imageName", "")))
-        max_lengths[3] = max(max_lengths[3], len(row_data.get("hostname", "")))
-        max_lengths[4] = max(max_lengths[4], len(formatted_time))
-        max_lengths[5] = max(max_lengths[5], len(str(row_data.get("port", ""))))
-        max_lengths[6] = max(max_lengths[6], len(row_data.get("processPath", "")))
-        max_lengths[7] = max(max_lengths[7], len(row_data.get("command", "")))
-        max_lengths[8] = max(max_lengths[8], len(row_data.get("namespace", "")))
-        max_lengths[9] = max(max_lengths[9], len(row_data.get("attackType", "")))
-        max_lengths[10] = max(max_lengths[10], len(row_data.get("msg", "")))
-        
-
-        row += 1
-    # Auto-fit columns
-    for col_num, length in enumerate(max_lengths):
-        worksheet.set_column(col_num, col_num, length +1)
-
-    # Close the workbook
-    workbook.close()
+    generation, stored = db.get_generation(name)
+    source = db.generation_source(name, generation)
+    time_range = parquet_store.TimeRange()
+    table = excel_writer.TableWriter(filepath, "{}".format(date_now.strftime("%Y-%m-%d")), cols, padding=1)
+    parquet_path = parquet_store.dataset_path(filepath)
+    parquet = parquet_store.ParquetTableWriter(parquet_path, parquet_store.RUNTIME_SCHEMA, None,
+                                                 sink=event_table_sink("runtime_events", source, filepath))
+    for events in timestamps.batches(data, TIME_BATCH):
+        times, typed_times = timestamps.to_gmt7([row_data.get('time', '') for row_data in events], parquet_store.RUNTIME_TIME_FORMAT,
+                                                convert_timezone_to_jakarta, fraction=True, since=timestamps.GMT7_SINCE)
+        time_range.add(typed_times)
+        for row_data, formatted_time, typed_time in zip(events, times, typed_times.to_pylist()):
+            values = [
+                row_data.get("containerName", ""),
+                row_data.get("cluster", ""),
+                row_data.get("imageName", ""),
+                row_data.get("hostname", ""),
+                formatted_time,
+                row_data.get("port", ""),
+                row_data.get("processPath", ""),
+                row_data.get("command", ""),
+                row_data.get("namespace", ""),
+                row_data.get("attackType", ""),
+                row_data.get("msg", "")
+            ]
+            table.write_row(values)
+            if table.rows <= stored:
+                continue
+            port = values[5]
+            values[4] = typed_time
+            values[5] = port if isinstance(port, int) and not isinstance(port, bool) else None
+            parquet.write_row(values, event_sink.event_key(row_data))
+
+    table.close()
+    parquet.close()
     
     # Save to DB
     gmt_7 = datetime.timezone(datetime.timedelta(hours=7))
     curr_time = datetime.datetime.now(gmt_7)
-    table = "runtime_files"
-    db.insert_file(filepath, table, curr_time)
+    with db.batch():
+        last_event = db.add_part("runtime_events", source, parquet_path, filepath, parquet.written)
+        db.insert_file(filepath, "runtime_files", curr_time, dataset=parquet_path, source=source, last_event=last_event, **report_metadata(filepath, table, time_range))
+        db.set_stored(name, generation, table.rows)
+    parts = [part for part in db.get_parts(filepath, "runtime_files") if os.path.exists(part)]
+    try:
+        aggregates.write_sidecar(filepath, parts, "runtime")
+    except Exception as e:
+        # The dashboard computes the charts itself when the sidecar is missing
+        print("Could not write chart aggregates: {}".format(e))
+    print("New events stored: ", parquet.written)
 if __name__ == "__main__":
     main()
\ No newline at end of file